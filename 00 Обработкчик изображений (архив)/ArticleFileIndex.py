@@ -0,0 +1,236 @@
+"""
+Пошук файлів зображень за артикулом.
+
+Артикул і ім'я файлу порівнюються в нормалізованому вигляді (лише літери і
+цифри в нижньому регістрі), а варіанти article_1, article_2 знаходяться і за
+базовим артикулом. ArticleFileIndex зберігає список файлів кількох папок
+(з recursive=True - разом з підпапками) у локальній базі SQLite. refresh() перечитує лише ті
+папки, чий mtime змінився (mtime папки змінюється, коли в ній додають,
+видаляють чи перейменовують файли), тож повторний запуск на великій мережевій
+папці зводиться до os.stat кожної підпапки, а пошук тисяч артикулів - до
+запитів по індексу бази.
+"""
+import os
+import re
+import sqlite3
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".article_file_index.sqlite")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')  # Порядок - пріоритет, якщо є кілька файлів одного артикулу
+
+_VARIANT_RE = re.compile(r'^(.+?)_(\d+)$')
+
+
+def normalize_name(name):
+    """Лише літери і цифри в нижньому регістрі: 'ART-12 a' -> 'art12a'."""
+    if name is None:
+        return ""
+    return re.sub(r'[^a-zA-Z0-9а-яА-Я]', '', str(name)).lower()
+
+
+def split_variant(stem):
+    """Базове ім'я і номер варіанту: 'art_2' -> ('art', 2), 'art' -> ('art', 0)."""
+    match = _VARIANT_RE.match(stem)
+    if match:
+        return match.group(1), int(match.group(2))
+    return stem, 0
+
+
+def _folder_depth(path):
+    """Глибина папки: файли ближче до кореня мають перевагу над вкладеними."""
+    return path.count(os.sep)
+
+
+def _normalize_roots(roots, recursive):
+    """
+    Абсолютні шляхи коренів без повторів. При recursive=True корінь усередині
+    іншого кореня вже входить до нього і об'єднується з ним (на місці першого
+    з них), інакше обидва переіндексовували б спільні папки під своїм ім'ям.
+    """
+    result = []
+    for root in (os.path.abspath(root) for root in roots):
+        key = os.path.normcase(root)
+        parent = next((kept for kept in result if os.path.normcase(kept) == key or (
+            recursive and key.startswith(os.path.join(os.path.normcase(kept), '')))), None)
+        if parent is not None:
+            if os.path.normcase(parent) != key:
+                print(f"  ! Папка {root} вже входить до {parent}, пропущено")
+            continue
+        nested = [kept for kept in result
+                  if recursive and os.path.normcase(kept).startswith(os.path.join(key, ''))]
+        for kept in nested:
+            print(f"  ! Папка {kept} вже входить до {root}, пропущено")
+        if nested:
+            position = result.index(nested[0])
+            result = [kept for kept in result if kept not in nested]
+            result.insert(position, root)
+        else:
+            result.append(root)
+    return result
+
+
+class ArticleFileIndex:
+    """
+    Постійний індекс "нормалізоване ім'я -> файли" для папок roots (з
+    recursive=True - і всіх їх підпапок; інакше лише файли самих roots).
+    """
+
+    def __init__(self, roots, index_path=DEFAULT_INDEX_PATH, extensions=IMAGE_EXTENSIONS, recursive=True):
+        self.recursive = recursive
+        self.roots = _normalize_roots(roots, recursive)
+        self.extensions = [extension.lower() for extension in extensions]
+        self.index_path = index_path
+        self._conn = sqlite3.connect(index_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS folders ("
+            " path TEXT PRIMARY KEY, root TEXT, parent TEXT, mtime_ns INTEGER)"
+        )
+        # В індексі всі файли папок, розширення фільтруються при пошуку
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY, root TEXT, folder TEXT, stem_key TEXT, base_key TEXT,"
+            " variant INTEGER, extension TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS folders_parent ON folders (parent)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_folder ON files (folder)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_stem ON files (stem_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS files_base ON files (base_key)")
+
+    def _forget_folder(self, folder):
+        """Видаляє з індексу папку з усіма підпапками і файлами."""
+        prefix = os.path.join(folder, '')
+        self._conn.execute("DELETE FROM folders WHERE path = ? OR substr(path, 1, ?) = ?",
+                           (folder, len(prefix), prefix))
+        self._conn.execute("DELETE FROM files WHERE folder = ? OR substr(folder, 1, ?) = ?",
+                           (folder, len(prefix), prefix))
+
+    def _rescan_folder(self, root, folder, parent, mtime_ns):
+        """Перечитує вміст однієї папки (без підпапок). Повертає список підпапок."""
+        try:
+            entries = list(os.scandir(folder))
+        except OSError as e:
+            print(f"  ! Не вдалося прочитати папку {folder}: {e}")
+            return []
+        subfolders = []
+        rows = []
+        for entry in entries:
+            if entry.name.startswith(('.', '~$')):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.path)
+            elif entry.is_file():
+                stem, extension = os.path.splitext(entry.name)
+                base, variant = split_variant(stem)
+                rows.append((entry.path, root, folder, normalize_name(stem), normalize_name(base), variant,
+                             extension.lower()))
+        # Підпапки, що зникли з цієї папки
+        known = {path for (path,) in self._conn.execute("SELECT path FROM folders WHERE parent = ?", (folder,))}
+        for removed in known - set(subfolders):
+            self._forget_folder(removed)
+        self._conn.execute("DELETE FROM files WHERE folder = ?", (folder,))
+        self._conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self._conn.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?)", (folder, root, parent, mtime_ns))
+        # Нові підпапки записуються як ще не прочитані (mtime -1): без recursive вони не обходяться,
+        # а наступний обхід з recursive знайде їх і перечитає
+        self._conn.executemany("INSERT OR IGNORE INTO folders VALUES (?, ?, ?, -1)",
+                               [(subfolder, root, folder) for subfolder in subfolders])
+        return subfolders
+
+    def refresh(self):
+        """Оновлює індекс для всіх roots. Повертає (перечитано папок, всього папок)."""
+        rescanned = visited = 0
+        for root in self.roots:
+            stack = [(root, None)]
+            while stack:
+                folder, parent = stack.pop()
+                try:
+                    # mtime - до читання вмісту: файл, доданий під час читання, змінить його вже після
+                    mtime_ns = os.stat(folder).st_mtime_ns
+                except OSError:
+                    self._forget_folder(folder)
+                    continue
+                visited += 1
+                row = self._conn.execute("SELECT mtime_ns, root FROM folders WHERE path = ?", (folder,)).fetchone()
+                # Папка, проіндексована раніше як частина іншого кореня, перечитується під цим
+                if row is not None and row == (mtime_ns, root):
+                    subfolders = [path for (path,) in self._conn.execute(
+                        "SELECT path FROM folders WHERE parent = ?", (folder,))]
+                else:
+                    subfolders = self._rescan_folder(root, folder, parent, mtime_ns)
+                    rescanned += 1
+                if self.recursive:
+                    stack.extend((subfolder, folder) for subfolder in subfolders)
+        self._conn.commit()
+        return rescanned, visited
+
+    def _scope(self, extensions):
+        """Умова SQL і параметри: файли з roots (без recursive - лише з самих roots) з потрібними розширеннями."""
+        column = "root" if self.recursive else "folder"
+        condition = (f"{column} IN ({', '.join('?' * len(self.roots))})"
+                     f" AND extension IN ({', '.join('?' * len(extensions))})")
+        return condition, list(self.roots) + list(extensions)
+
+    def find(self, name, extensions=None):
+        """
+        Усі файли для артикулу name, від найкращого: спершу точний збіг імені
+        (за порядком roots, потім ближчі до кореня, потім за порядком розширень),
+        далі варіанти name_1, name_2, ...
+        """
+        key = normalize_name(name)
+        extensions = self.extensions if extensions is None else [extension.lower() for extension in extensions]
+        if not key or not self.roots or not extensions:
+            return []
+        condition, params = self._scope(extensions)
+        rows = self._conn.execute(
+            f"SELECT path, root, stem_key, variant, extension, folder FROM files"
+            f" WHERE (stem_key = ? OR base_key = ?) AND {condition}", [key, key] + params
+        ).fetchall()
+        rows.sort(key=lambda row: (row[2] != key, row[3] if row[2] != key else 0, self._root_rank(row[1], row[5]),
+                                   _folder_depth(row[5]), extensions.index(row[4]), row[0]))
+        return [row[0] for row in rows]
+
+    def _root_rank(self, root, folder):
+        """Позиція кореня файлу в roots (без recursive корінь - сама папка файлу)."""
+        return self.roots.index(root if self.recursive else folder)
+
+    def resolve(self, name, extensions=None):
+        """Найкращий файл для артикулу name або None."""
+        candidates = self.find(name, extensions)
+        return candidates[0] if candidates else None
+
+    def collisions(self, extensions=None):
+        """
+        {нормалізоване ім'я: [файли]} для імен, під якими знайдено більше одного
+        файлу; файли - в тому ж порядку пріоритету, що й у find.
+        """
+        extensions = self.extensions if extensions is None else [extension.lower() for extension in extensions]
+        if not self.roots or not extensions:
+            return {}
+        condition, params = self._scope(extensions)
+        rows = self._conn.execute(
+            f"SELECT stem_key, path, root, folder, extension FROM files WHERE {condition} AND stem_key IN"
+            f" (SELECT stem_key FROM files WHERE {condition} GROUP BY stem_key HAVING COUNT(*) > 1)",
+            params + params).fetchall()
+        rows.sort(key=lambda row: (row[0], self._root_rank(row[2], row[3]), _folder_depth(row[3]),
+                                   extensions.index(row[4]), row[1]))
+        groups = {}
+        for stem_key, path, _, _, _ in rows:
+            groups.setdefault(stem_key, []).append(path)
+        return groups
+
+    def file_count(self, extensions=None):
+        """Кількість проіндексованих файлів з потрібними розширеннями."""
+        extensions = self.extensions if extensions is None else [extension.lower() for extension in extensions]
+        if not self.roots or not extensions:
+            return 0
+        condition, params = self._scope(extensions)
+        return self._conn.execute(f"SELECT COUNT(*) FROM files WHERE {condition}", params).fetchone()[0]
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
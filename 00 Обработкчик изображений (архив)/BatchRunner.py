@@ -0,0 +1,197 @@
+"""
+Паралельне виконання пофайлової обробки.
+
+run_tasks - пул процесів. Функція-обробник має бути визначена на верхньому
+рівні модуля (щоб її можна було передати в інший процес), а скрипт, що її
+викликає, - мати захист `if __name__ == "__main__":` (на Windows процеси
+стартують через spawn).
+
+run_pipelined - конвеєр "читання -> обробка -> запис" у трьох потоках для
+мережевих папок: поки файл обробляється, наступні вже читаються, а попередні
+записуються, тож затримки мережі перекриваються роботою процесора.
+"""
+import io
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stderr, redirect_stdout
+
+from StageMetrics import StageMetrics, current_metrics, set_metrics
+
+
+def call_captured(func, args, quiet=False):
+    """
+    Виконує func(*args) у воркері, перехоплюючи весь вивід print/traceback.
+    Заміри етапів збираються в пам'ять і повертаються разом з виводом.
+    """
+    metrics = StageMetrics(quiet=quiet, collect=True)
+    set_metrics(metrics)
+    buffer = io.StringIO()
+    with redirect_stdout(buffer), redirect_stderr(buffer):
+        try:
+            result = func(*args)
+        except Exception:
+            traceback.print_exc()
+            result = None
+    return result, buffer.getvalue(), metrics.drain()
+
+
+def run_tasks(func, tasks, workers=1, window=None):
+    """
+    Виконує func(*args) для кожного кортежу args з tasks.
+
+    Генерує пари (args, result) у тому ж порядку, що й tasks. При workers <= 1
+    все виконується послідовно в поточному процесі, як і раніше. При workers > 1
+    завдання розподіляються по пулу процесів, а вивід кожного завдання
+    друкується цілим блоком у порядку завдань. Помилка окремого завдання
+    не зупиняє пакет - для нього повертається result = None.
+
+    window - скільки завдань пул може мати наперед (разом з тим, чий результат
+    віддається наступним); None - усі одразу. Обмежує пам'ять під готові
+    результати, якщо споживач забирає їх повільніше, ніж пул рахує.
+    """
+    tasks = list(tasks)
+    if workers is None or workers <= 1 or len(tasks) <= 1:
+        for args in tasks:
+            try:
+                result = func(*args)
+            except Exception:
+                traceback.print_exc()
+                result = None
+            yield args, result
+        return
+
+    metrics = current_metrics()
+    limit = len(tasks) if window is None else max(window, workers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()  # (args, future) у порядку tasks
+        submitted = 0
+        while pending or submitted < len(tasks):
+            while submitted < len(tasks) and len(pending) < limit:
+                args = tasks[submitted]
+                pending.append((args, executor.submit(call_captured, func, args, metrics.quiet)))
+                submitted += 1
+            args, future = pending.popleft()
+            try:
+                result, output, events = future.result()
+                metrics.merge(events)
+            except Exception as e:
+                # Сюди потрапляємо, якщо впав сам воркер (наприклад, нестача пам'яті)
+                result, output = None, f"!!! Помилка воркера для {args}: {e}\n"
+            if output:
+                print(output, end="")
+            yield args, result
+
+
+class _StageTimer:
+    """Час роботи і очікування одного етапу конвеєра."""
+
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0
+        self.wait_input = 0.0
+        self.wait_output = 0.0
+
+
+def _timed_get(q, timer):
+    start = time.perf_counter()
+    item = q.get()
+    timer.wait_input += time.perf_counter() - start
+    return item
+
+
+def _timed_put(q, item, timer):
+    start = time.perf_counter()
+    q.put(item)
+    timer.wait_output += time.perf_counter() - start
+
+
+def _run_stage(func, args, timer):
+    """Виконує етап для одного завдання; помилку друкує і повертає None."""
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    except Exception:
+        print(f"!!! Помилка на етапі '{timer.name}' для {args[0]}:")
+        traceback.print_exc()
+        current_metrics().file_done(str(args[0]), 'failed', stage=timer.name)
+        return None
+    finally:
+        timer.busy += time.perf_counter() - start
+
+
+def read_bytes(path):
+    """Читає файл повністю в пам'ять (етап читання конвеєра)."""
+    metrics = current_metrics()
+    with metrics.stage('read', str(path)):
+        with open(path, 'rb') as f:
+            data = f.read()
+    metrics.count('bytes_read', len(data))
+    return data
+
+
+_DONE = object()  # Маркер кінця черги
+
+
+def run_pipelined(tasks, read, process, write, prefetch_depth=4, write_depth=4):
+    """
+    Конвеєр з трьох етапів для кожного завдання task з tasks:
+      read(task) -> data                   потік читання, наперед до prefetch_depth файлів
+      process(task, data) -> result        поточний потік
+      write(task, result) -> value         потік запису, черга до write_depth результатів
+
+    Якщо read або process повернули None (файл пропущено чи сталася помилка),
+    наступні етапи для цього завдання не виконуються. Генерує пари (task, value)
+    у порядку tasks у міру завершення запису (value = None для пропущених).
+    Наприкінці друкує, скільки кожен етап працював і скільки чекав.
+    """
+    tasks = list(tasks)
+    read_timer, process_timer, write_timer = _StageTimer("читання"), _StageTimer("обробка"), _StageTimer("запис")
+    read_queue = queue.Queue(maxsize=max(1, prefetch_depth))
+    write_queue = queue.Queue(maxsize=max(1, write_depth))
+    done_queue = queue.Queue()
+
+    def reader():
+        for task in tasks:
+            data = _run_stage(read, (task,), read_timer)
+            _timed_put(read_queue, (task, data), read_timer)
+        read_queue.put(_DONE)
+
+    def writer():
+        while True:
+            item = _timed_get(write_queue, write_timer)
+            if item is _DONE:
+                break
+            task, result = item
+            value = _run_stage(write, (task, result), write_timer) if result is not None else None
+            done_queue.put((task, value))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    while True:
+        item = _timed_get(read_queue, process_timer)
+        if item is _DONE:
+            break
+        task, data = item
+        result = _run_stage(process, (task, data), process_timer) if data is not None else None
+        _timed_put(write_queue, (task, result), process_timer)
+        while not done_queue.empty():
+            yield done_queue.get()
+
+    write_queue.put(_DONE)
+    for thread in threads:
+        thread.join()
+    while not done_queue.empty():
+        yield done_queue.get()
+
+    total = time.perf_counter() - started
+    print(f"\nКонвеєр: {len(tasks)} файлів за {total:.1f} с")
+    for timer in (read_timer, process_timer, write_timer):
+        print(f"  - {timer.name}: робота {timer.busy:.1f} с, очікування вхідних {timer.wait_input:.1f} с, "
+              f"очікування черги далі {timer.wait_output:.1f} с")
@@ -0,0 +1,216 @@
+"""
+Сервіс, що стежить за папками і обробляє нові фото, щойно вони з'являються.
+
+DropFolderWatcher опитує mtime папок (працює і на SMB, де сповіщень файлової
+системи немає) і перечитує список файлів лише тоді, коли папка змінилась
+або в ній є файли, що ще дописуються. Файл вважається готовим, коли його
+розмір і mtime не змінювались settle_seconds секунд.
+
+serve - головний цикл: готові файли стають у чергу не довшу за queue_size
+(поки черга повна, папки не опитуються - це і є зворотний тиск), а обробник
+виконується в пулі з workers процесів. Глибина черги і швидкість друкуються
+кожні status_interval секунд і, якщо задано status_path, пишуться у файл JSON.
+"""
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from BatchRunner import call_captured
+from StageMetrics import current_metrics
+
+
+class DropFolderWatcher:
+    """Нові і змінені файли папок folders, що вже не дописуються."""
+
+    def __init__(self, folders, accept=None, settle_seconds=5.0, rescan_interval=300.0):
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.accept = accept                  # accept(folder, name) -> False, якщо файл не треба обробляти
+        self.settle_seconds = settle_seconds
+        # Перезапис файлу з тим самим ім'ям може не змінити mtime папки - тому зрідка перечитуємо все
+        self.rescan_interval = rescan_interval
+        self._folder_mtimes = {}
+        self._pending = {}   # (folder, name) -> ((розмір, mtime_ns), з якого часу без змін)
+        self._handled = {}   # (folder, name) -> (розмір, mtime_ns) на момент обробки
+        self._last_rescan = 0.0
+
+    def _folder_changed(self, folder, full_rescan):
+        try:
+            mtime_ns = os.stat(folder).st_mtime_ns
+        except OSError as e:
+            print(f"  ! Папка недоступна {folder}: {e}")
+            return False
+        changed = self._folder_mtimes.get(folder) != mtime_ns
+        self._folder_mtimes[folder] = mtime_ns
+        has_pending = any(key[0] == folder for key in self._pending)
+        return changed or has_pending or full_rescan
+
+    def poll(self, limit=None, exclude=()):
+        """
+        Повертає до limit готових файлів [(folder, name), ...], крім тих, що в exclude
+        (вже в черзі чи в роботі). Файли, що не потрапили в limit, повернуться наступного разу.
+        """
+        now = time.monotonic()
+        full_rescan = now - self._last_rescan >= self.rescan_interval
+        if full_rescan:
+            self._last_rescan = now
+        ready = []
+        for folder in self.folders:
+            if not self._folder_changed(folder, full_rescan):
+                continue
+            try:
+                entries = [entry for entry in os.scandir(folder) if entry.is_file()]
+            except OSError as e:
+                print(f"  ! Не вдалося прочитати папку {folder}: {e}")
+                continue
+            present = set()
+            for entry in entries:
+                key = (folder, entry.name)
+                present.add(key)
+                stat_result = entry.stat()
+                signature = (stat_result.st_size, stat_result.st_mtime_ns)
+                if self._handled.get(key) == signature or key in exclude:
+                    continue
+                pending = self._pending.get(key)
+                if pending is None or pending[0] != signature:
+                    self._pending[key] = (signature, now)  # Новий або ще дописується
+                    continue
+                if now - pending[1] < self.settle_seconds:
+                    continue
+                if limit is not None and len(ready) >= limit:
+                    continue
+                del self._pending[key]
+                if self.accept is not None and not self.accept(folder, entry.name):
+                    self._handled[key] = signature
+                    continue
+                ready.append(key)
+            # Файли, що зникли, поки чекали
+            for key in [key for key in self._pending if key[0] == folder and key not in present]:
+                del self._pending[key]
+        return ready
+
+    def mark_handled(self, folder, name):
+        """Запам'ятовує поточний стан файлу: поки він не зміниться, poll його не поверне."""
+        try:
+            stat_result = os.stat(os.path.join(folder, name))
+        except OSError:
+            self._handled.pop((folder, name), None)
+            return
+        self._handled[(folder, name)] = (stat_result.st_size, stat_result.st_mtime_ns)
+
+    @property
+    def pending_count(self):
+        """Скільки файлів ще дописуються."""
+        return len(self._pending)
+
+
+class ThroughputMeter:
+    """Кількість оброблених файлів за останні window секунд."""
+
+    def __init__(self, window=300.0):
+        self.window = window
+        self._times = deque()
+
+    def record(self):
+        self._times.append(time.monotonic())
+
+    def per_minute(self):
+        now = time.monotonic()
+        while self._times and now - self._times[0] > self.window:
+            self._times.popleft()
+        return len(self._times) * 60.0 / self.window
+
+
+def _write_status(status_path, status):
+    """Атомарно записує стан сервісу в JSON (щоб монітор не прочитав півфайлу)."""
+    temp_path = status_path + ".tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, status_path)
+    except OSError as e:
+        print(f"  ! Не вдалося записати стан сервісу {status_path}: {e}")
+
+
+def serve(watcher, handler, make_args, on_result=None, workers=2, queue_size=32, poll_interval=2.0,
+          status_interval=60.0, status_path=None):
+    """
+    Головний цикл сервісу (до Ctrl+C).
+
+    handler(*make_args(folder, name)) виконується в пулі процесів, тому handler має
+    бути визначений на верхньому рівні модуля. on_result(folder, name, result)
+    викликається в головному процесі після кожного файлу; він повертає імена файлів,
+    які обробник записав у ту саму папку, щоб сервіс не взяв їх у роботу знову.
+    """
+    metrics = current_metrics()
+    meter = ThroughputMeter()
+    queue = deque()
+    in_flight = {}   # future -> (folder, name)
+    totals = {'processed': 0, 'failed': 0}
+    started = time.time()
+    next_status = time.monotonic() + status_interval
+
+    def report():
+        status = {
+            'queue_depth': len(queue),
+            'in_flight': len(in_flight),
+            'settling': watcher.pending_count,
+            'processed': totals['processed'],
+            'failed': totals['failed'],
+            'files_per_minute': round(meter.per_minute(), 1),
+            'uptime_seconds': round(time.time() - started),
+        }
+        print(f"[{time.strftime('%H:%M:%S')}] Черга: {status['queue_depth']}, в роботі: {status['in_flight']}, "
+              f"дописуються: {status['settling']}, оброблено: {status['processed']}, "
+              f"помилок: {status['failed']}, швидкість: {status['files_per_minute']} файлів/хв")
+        if status_path:
+            _write_status(status_path, status)
+
+    def finish(future):
+        folder, name = in_flight.pop(future)
+        try:
+            result, output, events = future.result()
+            metrics.merge(events)
+        except Exception as e:
+            # Сюди потрапляємо, якщо впав сам воркер (наприклад, нестача пам'яті)
+            result, output = None, f"!!! Помилка воркера для {name}: {e}\n"
+        if output:
+            print(output, end="")
+        written = on_result(folder, name, result) if on_result is not None else ()
+        totals['processed' if result else 'failed'] += 1
+        meter.record()
+        watcher.mark_handled(folder, name)
+        for written_name in written or ():
+            watcher.mark_handled(folder, written_name)
+
+    print(f"Стежимо за папками ({len(watcher.folders)}): {', '.join(watcher.folders)}")
+    print("Зупинка - Ctrl+C.")
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        try:
+            while True:
+                for future in [future for future in in_flight if future.done()]:
+                    finish(future)
+
+                # Зворотний тиск: поки черга повна, нові файли не беремо (вони дочекаються в папці)
+                room = queue_size - len(queue)
+                if room > 0:
+                    queue.extend(watcher.poll(limit=room, exclude=set(queue) | set(in_flight.values())))
+                while queue and len(in_flight) < workers:
+                    folder, name = queue.popleft()
+                    future = executor.submit(call_captured, handler, make_args(folder, name), metrics.quiet)
+                    in_flight[future] = (folder, name)
+
+                if time.monotonic() >= next_status:
+                    report()
+                    next_status = time.monotonic() + status_interval
+                # Поки є файли в роботі, результати забираємо частіше, ніж опитуємо папки
+                time.sleep(min(poll_interval, 0.2) if in_flight else poll_interval)
+        except KeyboardInterrupt:
+            print("\nЗупинка: чекаємо завершення файлів у роботі...")
+            for future in list(in_flight):
+                if future.cancel():
+                    in_flight.pop(future)
+            for future in list(in_flight):
+                finish(future)
+    report()
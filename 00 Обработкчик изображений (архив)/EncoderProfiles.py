@@ -0,0 +1,69 @@
+"""
+Іменовані профілі кодування результату.
+
+Скрипти зберігають результат через encode_image(img, profile) і беруть
+розширення файлу з профілю (output_filename). Профіль 'archive' - це
+колишнє жорстко задане save(..., "JPEG", quality=95, optimize=True),
+тому він лишається профілем за замовчуванням.
+"""
+import io
+import os
+
+from PIL import features
+
+ENCODER_PROFILES = {
+    # Базовий JPEG без додаткового проходу оптимізації Хаффмана - найшвидший
+    'fast': {'format': 'JPEG', 'extension': '.jpg', 'params': {'quality': 90}},
+    # Прогресивний JPEG: менший файл для вітрини, завантажується поступово
+    'balanced': {'format': 'JPEG', 'extension': '.jpg',
+                 'params': {'quality': 85, 'optimize': True, 'progressive': True}},
+    # Як раніше у всіх скриптах
+    'archive': {'format': 'JPEG', 'extension': '.jpg', 'params': {'quality': 95, 'optimize': True}},
+    'webp': {'format': 'WEBP', 'extension': '.webp', 'params': {'quality': 85, 'method': 4}},
+    'avif': {'format': 'AVIF', 'extension': '.avif', 'params': {'quality': 70}, 'feature': 'avif'},
+}
+DEFAULT_PROFILE = 'archive'
+
+
+def is_profile_supported(name):
+    """True, якщо поточна збірка Pillow вміє кодувати у формат профілю."""
+    feature = ENCODER_PROFILES[name].get('feature')
+    if not feature:
+        return True
+    try:
+        return bool(features.check(feature))
+    except ValueError:  # Стара версія Pillow не знає такої можливості
+        return False
+
+
+def available_profiles():
+    """Назви профілів, доступних у цій збірці Pillow."""
+    return [name for name in ENCODER_PROFILES if is_profile_supported(name)]
+
+
+def get_profile(name=None):
+    """Профіль за назвою (None - профіль за замовчуванням). ValueError, якщо профіль невідомий чи недоступний."""
+    name = name or DEFAULT_PROFILE
+    if name not in ENCODER_PROFILES:
+        raise ValueError(f"Невідомий профіль кодування '{name}'. Доступні: {', '.join(available_profiles())}")
+    if not is_profile_supported(name):
+        raise ValueError(f"Профіль '{name}' недоступний: Pillow зібрано без підтримки {ENCODER_PROFILES[name]['format']}")
+    return ENCODER_PROFILES[name]
+
+
+def output_filename(filename, profile=None):
+    """Ім'я файлу результату: те саме ім'я з розширенням профілю."""
+    return os.path.splitext(filename)[0] + get_profile(profile)['extension']
+
+
+def save_image(img, fp, profile=None):
+    """Зберігає img у файл або файловий об'єкт fp за профілем."""
+    settings = get_profile(profile)
+    img.save(fp, settings['format'], **settings['params'])
+
+
+def encode_image(img, profile=None):
+    """Повертає байти img, закодованого за профілем."""
+    buffer = io.BytesIO()
+    save_image(img, buffer, profile)
+    return buffer.getvalue()
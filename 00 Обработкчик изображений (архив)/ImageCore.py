@@ -0,0 +1,476 @@
+"""
+Спільні функції обробки зображень для скриптів цієї папки.
+
+Скрипти імпортують модуль як `from ImageCore import ...` - він лежить поруч
+із ними, тому окремо налаштовувати шлях не потрібно.
+"""
+import io
+import os
+from collections import OrderedDict
+
+from PIL import Image, ImageChops
+
+try:
+    from PIL import ImageCms
+except ImportError:  # Pillow без LittleCMS: вбудовані профілі ігноруються, як раніше
+    ImageCms = None
+
+
+# --- Видалення білого фону ---
+def _threshold_lut(cutoff):
+    """Таблиця для Image.point: 255 для значень >= cutoff, інакше 0."""
+    return [255 if value >= cutoff else 0 for value in range(256)]
+
+
+def white_mask(img, tolerance):
+    """
+    Повертає маску (режим 'L') майже білих пікселів: 255 там, де R, G і B
+    не менші за 255 - tolerance, і 0 в усіх інших місцях.
+    """
+    lut = _threshold_lut(255 - tolerance)
+    bands = img.split()
+    mask = bands[0].point(lut)
+    for band in bands[1:3]:
+        # Маски містять лише 0/255, тому мінімум - це логічне "І"
+        mask = ImageChops.darker(mask, band.point(lut))
+    return mask
+
+
+def remove_white_background(img, tolerance, clear_color=False):
+    """
+    Видаляє майже білий фон з зображення RGBA.
+
+    Пікселі, у яких R, G і B >= 255 - tolerance, стають прозорими (альфа 0),
+    колір інших пікселів не змінюється. Якщо clear_color=True, колір прозорих
+    пікселів додатково замінюється на білий (255, 255, 255, 0).
+    Зображення RGBA змінюється на місці, інші режими спершу конвертуються.
+    """
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    mask = white_mask(img, tolerance)
+    if clear_color:
+        img.paste((255, 255, 255, 0), None, mask)
+    else:
+        # Віднімання з обрізанням до 0: під маскою альфа стає 0, поза нею - не змінюється
+        img.putalpha(ImageChops.subtract(img.getchannel('A'), mask))
+    return img
+# --- ---
+
+
+# --- Кольоровий профіль і орієнтація EXIF ---
+ICC_TRANSFORM_CACHE_SIZE = 8  # Скільки різних вбудованих профілів тримати готовими
+# Режими, які перетворюються в sRGB: CMYK і сірі - в RGB, RGB/RGBA - в той самий режим
+_SRGB_OUTPUT_MODES = {'RGB': 'RGB', 'RGBA': 'RGBA', 'CMYK': 'RGB', 'L': 'RGB'}
+# Значення тегу Orientation -> перетворення, що повертає кадр у нормальне положення
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+_srgb_profile = None
+_transform_cache = OrderedDict()  # (байти ICC, режим) -> перетворення в sRGB або None
+
+
+def _srgb_transform(icc_bytes, mode):
+    """
+    Перетворення ICC-профілю icc_bytes у sRGB для режиму mode, з кешу LRU.
+    None - перетворювати не треба (профіль уже sRGB) або неможливо (профіль пошкоджений
+    чи не відповідає режиму). Побудова перетворення дорога, тому кожен профіль будується один раз.
+    """
+    global _srgb_profile
+    key = (icc_bytes, mode)
+    if key in _transform_cache:
+        _transform_cache.move_to_end(key)
+        return _transform_cache[key]
+    try:
+        source = ImageCms.ImageCmsProfile(io.BytesIO(icc_bytes))
+        if 'srgb' in ImageCms.getProfileDescription(source).lower():
+            transform = None
+        else:
+            if _srgb_profile is None:
+                _srgb_profile = ImageCms.createProfile('sRGB')
+            transform = ImageCms.buildTransform(source, _srgb_profile, mode, _SRGB_OUTPUT_MODES[mode],
+                                                ImageCms.Intent.PERCEPTUAL)
+    except (ImageCms.PyCMSError, OSError, ValueError) as e:
+        print(f"  ! Вбудований колірний профіль не застосовано: {e}")
+        transform = None
+    _transform_cache[key] = transform
+    if len(_transform_cache) > ICC_TRANSFORM_CACHE_SIZE:
+        _transform_cache.popitem(last=False)
+    return transform
+
+
+def to_srgb(img):
+    """
+    Приводить декодований кадр до sRGB за вбудованим ICC-профілем і повертає його
+    в нормальне положення за тегом EXIF Orientation. Якщо профілю немає (або він
+    уже sRGB) і кадр не повернутий, повертається той самий об'єкт без змін.
+    Перетворення RGB/RGBA виконується на місці, без копії кадру.
+    """
+    # Тег читаємо до перетворення: новий кадр після applyTransform не має EXIF
+    method = _ORIENTATION_TRANSPOSE.get(img.getexif().get(0x0112))  # 0x0112 - Orientation
+    icc_bytes = img.info.get('icc_profile')
+    if icc_bytes and ImageCms is not None and img.mode in _SRGB_OUTPUT_MODES:
+        transform = _srgb_transform(icc_bytes, img.mode)
+        if transform is not None:
+            if _SRGB_OUTPUT_MODES[img.mode] == img.mode:
+                ImageCms.applyTransform(img, transform, inPlace=True)
+            else:
+                img = ImageCms.applyTransform(img, transform)
+            # Профіль більше не описує пікселі - не передаємо його далі
+            img.info.pop('icc_profile', None)
+    if method is not None:
+        img = img.transpose(method)
+    return img
+# --- ---
+
+
+# --- Обрізка, поля і масштабування без повнорозмірних проміжних копій ---
+PROXY_SCALE = 8              # Превью для пошуку меж: 1/8, як DC-коефіцієнти JPEG
+PROXY_MIN_PIXELS = 1000000   # Менші кадри швидше перевірити повністю
+TILE_MEGAPIXELS = 24         # Більші кадри crop_to_object конвертує і перевіряє смугами такого розміру
+
+
+def _mask_bbox(img, tolerance):
+    """Межі пікселів об'єкта за повною маскою (img - RGB або RGBA)."""
+    # Інвертована таблиця: 255 для "не білого" значення каналу
+    lut = [255 - value for value in _threshold_lut(255 - tolerance)]
+    if img.mode == 'RGB':
+        # getbbox кадру RGB враховує всі канали - це і є логічне "АБО", маска не потрібна
+        return img.point(lut * 3).getbbox()
+    bands = img.split()
+    mask = bands[0].point(lut)
+    for band in bands[1:3]:
+        # Піксель - частина об'єкта, якщо хоч один канал не білий (логічне "АБО")
+        mask = ImageChops.lighter(mask, band.point(lut))
+    if img.mode == 'RGBA':
+        # ... і якщо він не був прозорим від початку
+        mask = ImageChops.darker(mask, bands[3])
+    return mask.getbbox()
+
+
+def _region_has_object(img, box, tolerance):
+    """True, якщо в області box є хоч один піксель об'єкта."""
+    region = img.crop(box)
+    # Гістограма - один прохід без проміжних масок: якщо жоден канал не має
+    # значень, менших за поріг, об'єкта в області немає
+    histogram = region.histogram()
+    cutoff = 255 - tolerance
+    if not any(any(histogram[band * 256:band * 256 + cutoff]) for band in range(3)):
+        return False
+    if img.mode == 'RGB':
+        return True
+    return _mask_bbox(region, tolerance) is not None
+
+
+def _refine_edges(img, box, tolerance, step):
+    """
+    Точні межі об'єкта всередині box: від кожного краю box смуги шириною step
+    перевіряються вглиб, доки не знайдеться піксель об'єкта. Середина кадру не читається.
+    """
+    left, upper, right, lower = box
+    top = None
+    for y in range(upper, lower, step):
+        found = _mask_bbox(img.crop((left, y, right, min(y + step, lower))), tolerance)
+        if found:
+            top = y + found[1]
+            break
+    if top is None:
+        return None
+    for y in range(lower, top, -step):
+        found = _mask_bbox(img.crop((left, max(y - step, top), right, y)), tolerance)
+        if found:
+            bottom = max(y - step, top) + found[3]
+            break
+    # Усі пікселі об'єкта лежать у рядках top..bottom, тож ліву і праву межі шукаємо лише там
+    for x in range(left, right, step):
+        found = _mask_bbox(img.crop((x, top, min(x + step, right), bottom)), tolerance)
+        if found:
+            first = x + found[0]
+            break
+    for x in range(right, first, -step):
+        found = _mask_bbox(img.crop((max(x - step, first), top, x, bottom)), tolerance)
+        if found:
+            last = max(x - step, first) + found[2]
+            break
+    return first, top, last, bottom
+
+
+def object_bbox(img, tolerance):
+    """
+    Межі об'єкта (left, upper, right, lower) - область пікселів, що лишаться
+    непрозорими після remove_white_background, або None, якщо таких немає.
+    Для RGB/RGBA рахується по каналах оригіналу без конвертації всього кадру.
+
+    Для великих кадрів наближені межі шукаються на превью 1/PROXY_SCALE. Поле
+    за ними перевіряється на відсутність об'єкта (гістограма області), а точні межі
+    уточнюються вузькими смугами вздовж країв. Результат той самий, що й за
+    повною маскою; якщо превью помилилось, рахується повна маска.
+    """
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA')
+    width, height = img.size
+    if width * height < PROXY_MIN_PIXELS:
+        return _mask_bbox(img, tolerance)
+
+    approx = _mask_bbox(img.reduce(PROXY_SCALE), tolerance)
+    if not approx:
+        return _mask_bbox(img, tolerance)
+    # +1 піксель превью з кожного боку: тонкі краї об'єкта могли розмитися в білий
+    box = (max(0, (approx[0] - 1) * PROXY_SCALE), max(0, (approx[1] - 1) * PROXY_SCALE),
+           min(width, (approx[2] + 1) * PROXY_SCALE), min(height, (approx[3] + 1) * PROXY_SCALE))
+    outside = [(0, 0, width, box[1]), (0, box[3], width, height),
+               (0, box[1], box[0], box[3]), (box[2], box[1], width, box[3])]
+    for region in outside:
+        if region[0] < region[2] and region[1] < region[3] and _region_has_object(img, region, tolerance):
+            return _mask_bbox(img, tolerance)
+    return _refine_edges(img, box, tolerance, 2 * PROXY_SCALE)
+
+
+def iter_strips(img, box=None, max_megapixels=TILE_MEGAPIXELS):
+    """
+    Генерує пари (верхній рядок відносно box, смуга) - горизонтальні смуги
+    області box (за замовчуванням весь кадр) по max_megapixels, але не менше рядка.
+    """
+    left, upper, right, lower = box or (0, 0) + img.size
+    rows = max(1, int(max_megapixels * 1000000) // max(right - left, 1))
+    for top in range(upper, lower, rows):
+        yield top - upper, img.crop((left, top, right, min(top + rows, lower)))
+
+
+def object_bbox_tiled(img, tolerance, max_megapixels=TILE_MEGAPIXELS):
+    """
+    Те саме, що object_bbox, але кадр конвертується і перевіряється смугами
+    по max_megapixels: для 16-бітних PNG, TIFF у CMYK тощо не створюється
+    повнорозмірна копія RGBA та маски розміру всього кадру.
+    """
+    bbox = None
+    for top, strip in iter_strips(img, max_megapixels=max_megapixels):
+        found = object_bbox(strip, tolerance)
+        if found is None:
+            continue
+        found = (found[0], top + found[1], found[2], top + found[3])
+        if bbox is None:
+            bbox = found
+        else:
+            bbox = (min(bbox[0], found[0]), bbox[1], max(bbox[2], found[2]), found[3])
+    return bbox
+
+
+def crop_to_object(img, tolerance, tile_megapixels=TILE_MEGAPIXELS):
+    """
+    Обрізає зображення до меж об'єкта і видаляє білий фон лише в цій області.
+    Повертає RGBA або None, якщо після видалення фону зображення порожнє.
+    Результат той самий, що й convert('RGBA') -> remove_white_background -> обрізка по альфі.
+
+    Кадри, більші за tile_megapixels (None - без обмеження), обробляються смугами:
+    у пам'яті, крім самого кадру, лише поточна смуга і обрізана область у RGBA.
+    """
+    width, height = img.size
+    if not tile_megapixels or width * height <= tile_megapixels * 1000000:
+        bbox = object_bbox(img, tolerance)
+        if not bbox:
+            return None
+        return remove_white_background(img.crop(bbox).convert('RGBA'), tolerance)
+
+    bbox = object_bbox_tiled(img, tolerance, tile_megapixels)
+    if not bbox:
+        return None
+    cropped = Image.new('RGBA', (bbox[2] - bbox[0], bbox[3] - bbox[1]))
+    for top, strip in iter_strips(img, bbox, tile_megapixels):
+        cropped.paste(remove_white_background(strip.convert('RGBA'), tolerance), (0, top))
+    return cropped
+
+
+def pad_and_flatten(img, percent, background=(255, 255, 255)):
+    """
+    Додає поля (percent від найдовшої сторони) навколо RGBA зображення і
+    одразу кладе його на суцільний фон. Повертає RGB.
+
+    Піксель у піксель відповідає старому ланцюжку "прозорий холст з полями ->
+    paste з маскою -> заливка фону", але без холста RGBA повного розміру.
+    """
+    width, height = img.size
+    if percent <= 0 or width == 0 or height == 0:
+        padding_pixels = 0
+        layer = img
+    else:
+        padding_pixels = int(max(width, height) * (percent / 100.0))
+        # Старий add_padding вставляв зображення на прозорий холст з маскою = альфа,
+        # що множить і колір, і альфу на альфу. Повторюємо це на області розміру об'єкта.
+        layer = Image.new('RGBA', img.size, (0, 0, 0, 0))
+        layer.paste(img, (0, 0), img)
+
+    result = Image.new('RGB', (width + 2 * padding_pixels, height + 2 * padding_pixels), background)
+    result.paste(layer, (padding_pixels, padding_pixels), layer.getchannel('A'))
+    return result
+
+
+_canvas_cache = {}
+
+
+def _white_canvas(target_size, background):
+    """Повертає холст target_size x target_size, перевикористовуючи його між файлами."""
+    key = (target_size, background)
+    canvas = _canvas_cache.get(key)
+    if canvas is None:
+        canvas = _canvas_cache[key] = Image.new('RGB', (target_size, target_size), background)
+    else:
+        canvas.paste(background, (0, 0, target_size, target_size))
+    return canvas
+
+
+def fit_to_square(img, target_size=1500, background=(255, 255, 255)):
+    """
+    Масштабує RGB зображення (LANCZOS, зі збереженням пропорцій) і центрує на
+    квадратному холсті target_size x target_size.
+
+    Холст перевикористовується наступним викликом у цьому ж процесі, тому
+    результат треба зберегти (або скопіювати) до обробки наступного файлу.
+    """
+    width, height = img.size
+    if (width, height) != (target_size, target_size) and width > 0 and height > 0:
+        ratio = min(target_size / width, target_size / height)
+        new_width = int(width * ratio)
+        new_height = int(height * ratio)
+        if new_width > 0 and new_height > 0:
+            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            width, height = new_width, new_height
+
+    canvas = _white_canvas(target_size, background)
+    canvas.paste(img, ((target_size - width) // 2, (target_size - height) // 2))
+    return canvas
+
+
+def render_product_square(img, tolerance, padding_percent, target_size=1500, tile_megapixels=TILE_MEGAPIXELS):
+    """
+    Повний шлях "фото товару -> квадрат на білому фоні": межі об'єкта, обрізка,
+    поля, білий фон, масштабування. Повертає RGB target_size x target_size
+    (див. fit_to_square щодо перевикористання холста) або None, якщо зображення порожнє.
+    tile_megapixels - див. crop_to_object.
+    """
+    cropped = crop_to_object(img, tolerance, tile_megapixels)
+    if cropped is None:
+        return None
+    return fit_to_square(pad_and_flatten(cropped, padding_percent), target_size)
+# --- ---
+
+
+# --- Файл, що вже має вигляд результату ---
+def is_normalized_square(source, tolerance, padding_percent, target_size=1500, image_format='JPEG'):
+    """
+    True, якщо source (шлях або файловий об'єкт) уже виглядає як результат
+    render_product_square з тими самими параметрами: формат image_format, розмір
+    target_size x target_size, смуги полів padding_percent уздовж усіх країв білі
+    (за допуском tolerance), а об'єкт з найближчого боку доходить до межі поля.
+    Тобто повторна обробка дала б той самий кадр.
+
+    З інших боків поле може бути ширшим: об'єкт не обов'язково торкається всіх меж.
+    Файловий об'єкт після перевірки повертається на початок.
+    """
+    try:
+        with Image.open(source) as img:
+            if img.format != image_format or img.size != (target_size, target_size):
+                return False
+            bbox = object_bbox(img, tolerance)
+    finally:
+        if not isinstance(source, str):
+            source.seek(0)
+    if not bbox:
+        return False
+
+    # Очікуване поле: padding_percent від довшої сторони об'єкта, після масштабування до target_size
+    share = max(padding_percent, 0) / 100.0
+    expected = target_size * share / (1 + 2 * share)
+    # Допуск: блок JPEG (ореол стиснення по краю об'єкта) і 1% сторони (округлення при масштабуванні)
+    slack = 8 + target_size * 0.01
+    nearest = min(bbox[0], bbox[1], target_size - bbox[2], target_size - bbox[3])
+    return abs(nearest - expected) <= slack
+# --- ---
+
+
+# --- Похідні розміри (1500 -> 800 -> 300) ---
+# Правило імені похідного файлу: photo.jpg -> photo_800px.jpg. Не "_{size}": так нумеруються
+# файли артикулу (article_1, article_2), і ArticleFileIndex вважав би похідні варіантами
+DERIVATIVE_SUFFIX = "_{size}px"
+
+
+def cascade_resize(square, sizes):
+    """
+    Генерує пари (size, зображення size x size) для кожного з sizes за спаданням.
+    Кожен наступний розмір зменшується з попереднього, а не з оригіналу,
+    тому дрібні розміри майже нічого не коштують.
+    """
+    img = square
+    for size in sorted(sizes, reverse=True):
+        img = img.resize((size, size), Image.Resampling.LANCZOS)
+        yield size, img
+
+
+def derivative_filename(filename, size, suffix=DERIVATIVE_SUFFIX):
+    """Ім'я похідного файлу: суфікс за правилом suffix перед розширенням."""
+    base_name, extension = os.path.splitext(filename)
+    return base_name + suffix.format(size=size) + extension
+
+
+def is_derivative_filename(filename, sizes, suffix=DERIVATIVE_SUFFIX):
+    """True, якщо ім'я файлу закінчується суфіксом одного з похідних розмірів sizes."""
+    base_name = os.path.splitext(filename)[0]
+    return any(base_name.endswith(suffix.format(size=size)) for size in sizes)
+# --- ---
+
+
+# --- Зменшене декодування JPEG (draft) ---
+JPEG_DRAFT_SCALES = (8, 4, 2)  # Масштаби DCT, які вміє декодер JPEG (1/8, 1/4, 1/2)
+
+
+def choose_draft_scale(probe, tolerance, padding_percent, target_size):
+    """
+    Обирає найбільший дільник з JPEG_DRAFT_SCALES, при якому обрізаний об'єкт
+    разом із полями ще має щонайменше target_size пікселів по довшій стороні.
+    probe - щойно відкритий (ще не декодований) JPEG, він декодується як превью 1/8.
+    Повертає 1, якщо зменшувати не можна.
+    """
+    width, height = probe.size
+    probe.draft(probe.mode, (max(1, width // 8), max(1, height // 8)))
+    proxy_scale = width / probe.size[0]
+    bbox = object_bbox(probe, tolerance)
+    if not bbox:
+        return 1
+    # +1 піксель превью з кожного боку: тонкі краї об'єкта могли розмитися в білий
+    object_side = (max(bbox[2] - bbox[0], bbox[3] - bbox[1]) + 2) * proxy_scale
+    padded_side = object_side * (1 + 2 * max(padding_percent, 0) / 100.0)
+    for scale in JPEG_DRAFT_SCALES:
+        if padded_side / scale >= target_size:
+            return scale
+    return 1
+
+
+def open_for_square(path, tolerance, padding_percent, target_size=1500, draft=True):
+    """
+    Відкриває зображення для обробки в квадрат target_size.
+
+    Для JPEG при draft=True файл читається один раз у пам'ять, за превью 1/8
+    оцінюються межі об'єкта, і декодер одразу масштабує DCT (1/2, 1/4, 1/8) так,
+    щоб обрізаному об'єкту з полями вистачило роздільності. Якщо об'єкт займає
+    малу частину кадру, декодується повний розмір. Для інших форматів - звичайний Image.open.
+    """
+    img = Image.open(path)
+    if not draft or img.format != 'JPEG' or min(img.size) < target_size:
+        return img
+
+    img.fp.seek(0)
+    data = img.fp.read()
+    img.close()
+    probe = Image.open(io.BytesIO(data))
+    scale = choose_draft_scale(probe, tolerance, padding_percent, target_size)
+    img = Image.open(io.BytesIO(data))
+    if scale > 1:
+        width, height = img.size
+        img.draft(img.mode, (width // scale, height // scale))
+    return img
+# --- ---
@@ -0,0 +1,173 @@
+"""
+Розміри зображень без декодування пікселів.
+
+probe_image_size читає лише заголовок файлу (JPEG, PNG, GIF, BMP, WebP, TIFF),
+для інших форматів - ліниве Image.open. ImageSizeIndex зберігає результати
+в локальній базі SQLite за ключем (шлях, розмір файлу, mtime), тож повторне
+сканування мережевої папки зводиться до читання метаданих каталогу.
+"""
+import os
+import sqlite3
+import struct
+
+from PIL import Image
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".image_size_index.sqlite")
+
+# Маркери SOFn, у яких зберігаються розміри кадру JPEG (C4, C8, CC - інші сегменти)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        while byte == b'\xff':  # Байти-заповнювачі перед маркером
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker == 0xD9 or marker == 0xDA:  # Кінець файлу або початок даних без SOF
+            return None
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # Маркери без довжини
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if marker in _JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>HH', data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _tiff_size(f, header):
+    endian = '<' if header[:2] == b'II' else '>'
+    if struct.unpack(endian + 'H', header[2:4])[0] != 42:
+        return None  # BigTIFF та інше - через Pillow
+    f.seek(struct.unpack(endian + 'I', header[4:8])[0])
+    count_bytes = f.read(2)
+    if len(count_bytes) < 2:
+        return None
+    width = height = None
+    for _ in range(struct.unpack(endian + 'H', count_bytes)[0]):
+        entry = f.read(12)
+        if len(entry) < 12:
+            return None
+        tag, value_type = struct.unpack(endian + 'HH', entry[:4])
+        if tag not in (256, 257):
+            continue
+        if value_type == 3:  # SHORT
+            value = struct.unpack(endian + 'H', entry[8:10])[0]
+        else:  # LONG
+            value = struct.unpack(endian + 'I', entry[8:12])[0]
+        if tag == 256:
+            width = value
+        else:
+            height = value
+        if width is not None and height is not None:
+            return width, height
+    return None
+
+
+def _header_size(f):
+    """Розмір за заголовком відкритого файлу або None, якщо формат не розпізнано."""
+    header = f.read(32)
+    if header[:2] == b'\xff\xd8':
+        return _jpeg_size(f)
+    if header[:8] == b'\x89PNG\r\n\x1a\n' and header[12:16] == b'IHDR':
+        return struct.unpack('>II', header[16:24])
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', header[6:10])
+    if header[:2] == b'BM':
+        if struct.unpack('<I', header[14:18])[0] == 12:  # BITMAPCOREHEADER
+            return struct.unpack('<HH', header[18:22])
+        width, height = struct.unpack('<ii', header[18:26])
+        return width, abs(height)  # Від'ємна висота - рядки зверху вниз
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        chunk = header[12:16]
+        if chunk == b'VP8X':
+            width = int.from_bytes(header[24:27], 'little') + 1
+            height = int.from_bytes(header[27:30], 'little') + 1
+            return width, height
+        if chunk == b'VP8 ' and header[23:26] == b'\x9d\x01\x2a':
+            width, height = struct.unpack('<HH', header[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L' and header[20] == 0x2F:
+            bits = int.from_bytes(header[21:25], 'little')
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        return None
+    if header[:4] in (b'II*\x00', b'MM\x00*'):
+        return _tiff_size(f, header)
+    return None
+
+
+def probe_image_size(path):
+    """
+    Повертає (width, height) зображення, читаючи лише заголовок файлу.
+    Невідомі формати відкриваються через Pillow (теж без декодування пікселів).
+    Кидає виняток, якщо файл не вдалося прочитати як зображення.
+    """
+    with open(path, 'rb') as f:
+        size = _header_size(f)
+    if size:
+        return tuple(size)
+    with Image.open(path) as img:
+        return img.size
+
+
+class ImageSizeIndex:
+    """Постійний індекс розмірів зображень: (шлях, розмір файлу, mtime) -> (width, height)."""
+
+    COMMIT_EVERY = 500  # Як часто зберігати нові записи на диск
+
+    def __init__(self, index_path=DEFAULT_INDEX_PATH):
+        self.index_path = index_path
+        # З'єднання може використовуватися з потоку читання конвеєра (по одному потоку за раз)
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_size ("
+            " path TEXT PRIMARY KEY, file_size INTEGER, mtime_ns INTEGER, width INTEGER, height INTEGER)"
+        )
+        self._pending = 0
+
+    def get_size(self, path, stat_result=None):
+        """
+        (width, height) для файлу. stat_result можна передати з os.scandir
+        (DirEntry.stat()), тоді на Windows не буде окремого запиту до мережі.
+        Якщо файл змінився або ще не індексований - читається заголовок.
+        """
+        path = os.path.abspath(path)
+        if stat_result is None:
+            stat_result = os.stat(path)
+        row = self._conn.execute(
+            "SELECT file_size, mtime_ns, width, height FROM image_size WHERE path = ?", (path,)
+        ).fetchone()
+        if row and row[0] == stat_result.st_size and row[1] == stat_result.st_mtime_ns:
+            return row[2], row[3]
+
+        width, height = probe_image_size(path)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO image_size (path, file_size, mtime_ns, width, height) VALUES (?, ?, ?, ?, ?)",
+            (path, stat_result.st_size, stat_result.st_mtime_ns, width, height),
+        )
+        self._pending += 1
+        if self._pending >= self.COMMIT_EVERY:
+            self._conn.commit()
+            self._pending = 0
+        return width, height
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,7 +1,10 @@
 import math
 import os
 import glob
-from PIL import Image, ImageChops, ImageOps
+from PIL import Image, ImageOps
+
+from EncoderProfiles import output_filename, save_image
+from ImageCore import crop_to_object, object_bbox, to_srgb
 
 # --- Налаштування ---
 # !!! ВАЖЛИВО: Вкажіть тут шлях до папки з вашими зображеннями !!!
@@ -13,6 +16,16 @@ SOURCE_DIRECTORY = r"C:\Users\ABM\Desktop\MM"
 # Якщо більше 0 (наприклад, 3), буде використано саме ця кількість стовпців.
 FORCED_GRID_COLS = 0
 
+# --- Потоковий режим ---
+# True: зображення читаються двічі (спершу лише розміри, потім обробка і вставка по одному),
+# тож у пам'яті одночасно лише одне зображення і холст. Для десятків великих фото.
+STREAMING_MODE = False
+
+# --- Профіль кодування результату (див. EncoderProfiles.py) ---
+# None: JPEG з якістю DEFAULT_OUTPUT_QUALITY, як раніше. Або 'fast', 'balanced', 'archive', 'webp', 'avif' -
+# тоді розширення файлу результату береться з профілю.
+OUTPUT_PROFILE = None
+
 # --- Константи ---
 DEFAULT_WHITE_TOLERANCE = 10
 DEFAULT_SPACING_PERCENT = 10
@@ -21,60 +34,17 @@ DEFAULT_OUTPUT_QUALITY = 95
 SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')
 # --- ---
 
-def remove_white_background(img, tolerance=DEFAULT_WHITE_TOLERANCE):
-    """Видаляє майже білий фон з зображення RGBA."""
-    if img.mode != 'RGBA':
-        img = img.convert('RGBA')
-
-    datas = img.getdata()
-    newData = []
-    cutoff = 255 - tolerance
-    for item in datas:
-        if item[0] >= cutoff and item[1] >= cutoff and item[2] >= cutoff:
-            newData.append((item[0], item[1], item[2], 0))
-        else:
-            newData.append(item)
-
-    img.putdata(newData)
-    return img
-
-def crop_transparent_border(img):
-    """Обрізає порожній (прозорий) простір навколо зображення."""
-    # Переконуємося, що працюємо з копією для конвертації, якщо потрібно
-    temp_img = img if img.mode == 'RGBA' else img.convert('RGBA')
-    bg = Image.new('RGBA', temp_img.size, (0,0,0,0))
-    try:
-        # Використовуємо ImageChops.difference для більш надійного визначення меж
-        diff = ImageChops.difference(temp_img, bg)
-        # Використовуємо альфа-канал різниці для bbox, якщо він є
-        if diff.mode == 'RGBA':
-            bbox = diff.split()[-1].getbbox() # Беремо bbox з альфа-каналу
-            if not bbox: # Якщо альфа-канал порожній, спробуємо весь diff
-                bbox = diff.getbbox()
-        else: # Якщо різниця не RGBA (малоймовірно, але можливо)
-            bbox = diff.getbbox()
-
-    except ValueError:
-        bbox = None # Якщо зображення повністю збігається з фоном
-
-    if bbox:
-        # Обрізаємо оригінальне зображення (img), а не тимчасове (temp_img)
-        return img.crop(bbox)
-    else:
-        # print("Попередження: Не вдалося знайти межі об'єкта. Пропуск обрізки.")
-        return img # Повертаємо те, що є
-
 def process_image(image_path, white_tolerance):
     """Завантажує, видаляє фон та обрізає одне зображення."""
     try:
-        img = Image.open(image_path)
-        img = img.convert("RGBA") # Завжди конвертуємо в RGBA на початку
+        # Вбудований колірний профіль -> sRGB і поворот за EXIF
+        img = to_srgb(Image.open(image_path))
 
-        img_no_bg = remove_white_background(img, white_tolerance)
-        img_cropped = crop_transparent_border(img_no_bg)
+        # Межі об'єкта шукаємо одразу за маскою білого, фон видаляємо лише в обрізаній області
+        img_cropped = crop_to_object(img, white_tolerance)
 
         # Перевірка, чи щось залишилось після обрізки
-        if img_cropped is None or not img_cropped.getbbox():
+        if img_cropped is None:
              # print(f"Попередження: Зображення '{os.path.basename(image_path)}' стало порожнім.")
              return None
 
@@ -87,21 +57,47 @@ def process_image(image_path, white_tolerance):
         print(f"Помилка обробки файлу {os.path.basename(image_path)}: {e}")
         return None
 
-def combine_images(image_paths, output_path, forced_cols=0, spacing_percent=DEFAULT_SPACING_PERCENT, white_tolerance=DEFAULT_WHITE_TOLERANCE, quality=DEFAULT_OUTPUT_QUALITY):
-    """Обробляє та об'єднує зображення у сітку."""
+def measure_image(image_path, white_tolerance):
+    """Повертає розмір (width, height), який матиме зображення після process_image, або None."""
+    try:
+        with Image.open(image_path) as img:
+            # Так само, як у process_image: повернутий кадр має інші ширину і висоту
+            bbox = object_bbox(to_srgb(img), white_tolerance)
+        if not bbox:
+            return None
+        return bbox[2] - bbox[0], bbox[3] - bbox[1]
+    except FileNotFoundError:
+        print(f"Помилка: Файл не знайдено '{image_path}'")
+        return None
+    except Exception as e:
+        print(f"Помилка обробки файлу {os.path.basename(image_path)}: {e}")
+        return None
+
+def combine_images(image_paths, output_path, forced_cols=0, spacing_percent=DEFAULT_SPACING_PERCENT, white_tolerance=DEFAULT_WHITE_TOLERANCE, quality=DEFAULT_OUTPUT_QUALITY, streaming=False, profile=None):
+    """
+    Обробляє та об'єднує зображення у сітку.
+    streaming=True - два проходи: спершу лише розміри для розкладки, потім
+    кожне зображення обробляється і вставляється окремо (пам'ять: одне фото + холст).
+    """
     if not image_paths:
         print("У вказаній папці не знайдено підтримуваних зображень.")
         return
 
+    # Елементи: (шлях, оброблене зображення або None у потоковому режимі, розмір)
     processed_images = []
-    print("Обробка зображень...")
+    print("Обробка зображень..." if not streaming else "Прохід 1: визначення розмірів зображень...")
     for path in image_paths:
         if os.path.basename(path) == os.path.basename(output_path):
             #print(f"Пропуск файлу '{os.path.basename(path)}' (схоже на попередній результат).")
             continue
 
         print(f" - Обробка: {os.path.basename(path)}")
-        processed = process_image(path, white_tolerance)
+        if streaming:
+            size = measure_image(path, white_tolerance)
+            processed = (path, None, size) if size else None
+        else:
+            img = process_image(path, white_tolerance)
+            processed = (path, img, img.size) if img is not None else None
         if processed:
             processed_images.append(processed)
         else:
@@ -128,10 +124,9 @@ def combine_images(image_paths, output_path, forced_cols=0, spacing_percent=DEFA
 
     max_w = 0
     max_h = 0
-    for img in processed_images:
-        if img and hasattr(img, 'width') and hasattr(img, 'height'):
-            max_w = max(max_w, img.width)
-            max_h = max(max_h, img.height)
+    for _, _, (img_width, img_height) in processed_images:
+        max_w = max(max_w, img_width)
+        max_h = max(max_h, img_height)
 
     if max_w == 0 or max_h == 0:
         print("Помилка: Не вдалося визначити розміри оброблених зображень.")
@@ -147,6 +142,8 @@ def combine_images(image_paths, output_path, forced_cols=0, spacing_percent=DEFA
     print(f"Створено холст: {canvas_width}x{canvas_height}px")
     print(f"Розмір комірки: {max_w}x{max_h}px, Відступи: H={h_spacing}px, V={v_spacing}px")
     print(f"Сітка: {grid_rows}x{grid_cols}")
+    if streaming:
+        print("Прохід 2: обробка та вставка зображень по одному...")
 
     current_image_index = 0
     for r in range(grid_rows):
@@ -162,10 +159,14 @@ def combine_images(image_paths, output_path, forced_cols=0, spacing_percent=DEFA
 
         for c in range(items_in_this_row): # Ітеруємо тільки по реальних елементах ряду
             if current_image_index < num_images: # Додаткова перевірка
-                img = processed_images[current_image_index]
+                path, img, (img_width, img_height) = processed_images[current_image_index]
                 if img is None:
-                     current_image_index += 1
-                     continue # Пропускаємо, якщо зображення було None
+                    # Потоковий режим: декодуємо і обробляємо тільки зараз, перед вставкою
+                    img = process_image(path, white_tolerance)
+                    if img is None or img.size != (img_width, img_height):
+                        print(f"   ! Файл змінився між проходами, пропуск: {os.path.basename(path)}")
+                        current_image_index += 1
+                        continue
 
                 # Розраховуємо позицію стовпця `c`
                 cell_x = h_spacing + c * (max_w + h_spacing) + extra_offset_x_for_last_row
@@ -181,6 +182,7 @@ def combine_images(image_paths, output_path, forced_cols=0, spacing_percent=DEFA
                     img = img.convert('RGBA')
                 # Використовуємо альфа-канал зображення як маску для коректної вставки прозорих пікселів
                 canvas.paste(img, (paste_x, paste_y), img)
+                img = None # Звільняємо до обробки наступного
 
                 current_image_index += 1
             else:
@@ -199,7 +201,10 @@ def combine_images(image_paths, output_path, forced_cols=0, spacing_percent=DEFA
         else:
              canvas_to_save = canvas
 
-        canvas_to_save.save(output_path, 'JPEG', quality=quality, optimize=True)
+        if profile:
+            save_image(canvas_to_save, output_path, profile)
+        else:
+            canvas_to_save.save(output_path, 'JPEG', quality=quality, optimize=True)
         print(f"Зображення успішно збережено в: {output_path}")
     except Exception as e:
         print(f"Помилка збереження файлу '{output_path}': {e}")
@@ -228,6 +233,8 @@ def run_processing():
     print(f"Знайдено {len(input_files)} потенційних зображень (відсортовано).")
 
     output_file_path = os.path.join(SOURCE_DIRECTORY, DEFAULT_OUTPUT_FILENAME)
+    if OUTPUT_PROFILE:
+        output_file_path = output_filename(output_file_path, OUTPUT_PROFILE)
 
     combine_images(
         image_paths=input_files,
@@ -235,7 +242,9 @@ def run_processing():
         forced_cols=FORCED_GRID_COLS, # Передаємо нове налаштування
         spacing_percent=DEFAULT_SPACING_PERCENT,
         white_tolerance=DEFAULT_WHITE_TOLERANCE,
-        quality=DEFAULT_OUTPUT_QUALITY
+        quality=DEFAULT_OUTPUT_QUALITY,
+        streaming=STREAMING_MODE,
+        profile=OUTPUT_PROFILE
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+"""
+Пошук майже однакових фото за перцептивним хешем (dHash).
+
+dHash рахується на зменшеній сірій копії (JPEG декодується одразу в
+масштабі 1/8 через draft), тож перекодовані і зменшені копії одного фото
+мають хеші, що відрізняються лише кількома бітами (відстань Геммінга).
+
+PerceptualHashIndex зберігає хеші в локальній базі SQLite за ключем
+(шлях, розмір файлу, mtime), як ImageSizeIndex: повторне update() хешує
+лише нові і змінені файли, причому в пулі процесів (BatchRunner.run_tasks).
+Пошук іде по BK-дереву, тому "схожі на X" і "усі групи дублікатів" не
+порівнюють кожне фото з кожним.
+"""
+import os
+import sqlite3
+
+from PIL import Image
+
+from BatchRunner import run_tasks
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".image_phash_index.sqlite")
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.tif', '.webp'}
+HASH_SIZE = 8            # 8x8 порівнянь - 64-бітний хеш
+DEFAULT_MAX_DISTANCE = 6  # До скількох різних бітів фото вважаються дублікатами
+
+
+def hamming(first, second):
+    """Кількість різних бітів двох хешів."""
+    return bin(first ^ second).count('1')
+
+
+def dhash(img, hash_size=HASH_SIZE):
+    """
+    dHash зображення: сіра копія (hash_size + 1) x hash_size, біт на кожну пару
+    сусідніх пікселів рядка (1, якщо лівий яскравіший). Прозорість - на білому фоні.
+    """
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, img)
+    small = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def hash_image(path):
+    """dHash файлу або None, якщо файл не вдалося прочитати (помилка друкується)."""
+    try:
+        with Image.open(path) as img:
+            # Для JPEG декодер одразу зменшує в 8 разів, для інших форматів - звичайне декодування
+            img.draft('RGB', (HASH_SIZE * 16, HASH_SIZE * 16))
+            img.thumbnail((HASH_SIZE * 16, HASH_SIZE * 16))
+            return dhash(img)
+    except Exception as e:
+        print(f"  ! Не вдалося обчислити хеш {path}: {e}")
+        return None
+
+
+class BKTree:
+    """BK-дерево за відстанню Геммінга: вузол - (хеш, [елементи], {відстань: дочірній вузол})."""
+
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    def add(self, hash_value, item):
+        self.size += 1
+        if self._root is None:
+            self._root = (hash_value, [item], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(hash_value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (hash_value, [item], {})
+                return
+            node = child
+
+    def search(self, hash_value, max_distance):
+        """Список (відстань, елемент) для всіх хешів не далі max_distance, від найближчих."""
+        results = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_hash, items, children = stack.pop()
+            distance = hamming(hash_value, node_hash)
+            if distance <= max_distance:
+                results.extend((distance, item) for item in items)
+            # Нерівність трикутника: глибше варто йти лише в гілки з відстанню в межах distance +- max_distance
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort()
+        return results
+
+
+def _scan_images(folder_path, extensions):
+    """Генерує (шлях, stat) усіх зображень у folder_path і підпапках."""
+    stack = [folder_path]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = list(os.scandir(current))
+        except OSError as e:
+            print(f"  ! Не вдалося прочитати папку {current}: {e}")
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif os.path.splitext(entry.name)[1].lower() in extensions:
+                # stat з os.scandir на Windows приходить разом зі списком папки
+                yield entry.path, entry.stat()
+
+
+class PerceptualHashIndex:
+    """Постійний індекс dHash: (шлях, розмір файлу, mtime) -> хеш, плюс BK-дерево для пошуку."""
+
+    COMMIT_EVERY = 500  # Як часто зберігати нові записи на диск
+
+    def __init__(self, index_path=DEFAULT_INDEX_PATH):
+        self.index_path = index_path
+        self._conn = sqlite3.connect(index_path)
+        # Хеш зберігається як 16 hex-символів: INTEGER у SQLite - знаковий 64-бітний
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_phash ("
+            " path TEXT PRIMARY KEY, file_size INTEGER, mtime_ns INTEGER, hash TEXT)"
+        )
+        self._tree = None
+
+    def update(self, folder_path, workers=1, extensions=IMAGE_EXTENSIONS):
+        """
+        Оновлює індекс для folder_path і підпапок: хешує нові та змінені файли
+        (workers процесів), видаляє записи зниклих. Повертає (хешовано, видалено).
+        """
+        folder_path = os.path.abspath(folder_path)
+        prefix = os.path.join(folder_path, '')
+        known = {path: (file_size, mtime_ns) for path, file_size, mtime_ns in self._conn.execute(
+            "SELECT path, file_size, mtime_ns FROM image_phash WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))}
+
+        changed = []
+        for path, stat_result in _scan_images(folder_path, extensions):
+            key = (stat_result.st_size, stat_result.st_mtime_ns)
+            if known.pop(path, None) != key:
+                changed.append((path, key))
+        print(f"Індекс хешів: змінених і нових файлів - {len(changed)}, зниклих - {len(known)}")
+
+        stats = dict(changed)
+        hashed = 0
+        for (path,), hash_value in run_tasks(hash_image, [(path,) for path, _ in changed], workers):
+            if hash_value is None:
+                continue
+            file_size, mtime_ns = stats[path]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO image_phash (path, file_size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                (path, file_size, mtime_ns, format(hash_value, '016x')),
+            )
+            hashed += 1
+            if hashed % self.COMMIT_EVERY == 0:
+                self._conn.commit()
+        self._conn.executemany("DELETE FROM image_phash WHERE path = ?", [(path,) for path in known])
+        self._conn.commit()
+        self._tree = None
+        return hashed, len(known)
+
+    def _get_tree(self):
+        if self._tree is None:
+            self._tree = BKTree()
+            for path, hash_text in self._conn.execute("SELECT path, hash FROM image_phash"):
+                self._tree.add(int(hash_text, 16), path)
+        return self._tree
+
+    def get_hash(self, path):
+        """Хеш файлу: з індексу, якщо файл не змінився, інакше обчислюється (без запису в індекс)."""
+        path = os.path.abspath(path)
+        stat_result = os.stat(path)
+        row = self._conn.execute(
+            "SELECT file_size, mtime_ns, hash FROM image_phash WHERE path = ?", (path,)
+        ).fetchone()
+        if row and row[0] == stat_result.st_size and row[1] == stat_result.st_mtime_ns:
+            return int(row[2], 16)
+        return hash_image(path)
+
+    def find_similar(self, path, max_distance=DEFAULT_MAX_DISTANCE):
+        """Список (відстань, шлях) проіндексованих фото, схожих на файл path (сам файл не входить)."""
+        hash_value = self.get_hash(path)
+        if hash_value is None:
+            return []
+        path = os.path.abspath(path)
+        return [(distance, other) for distance, other in self._get_tree().search(hash_value, max_distance)
+                if other != path]
+
+    def duplicate_clusters(self, max_distance=DEFAULT_MAX_DISTANCE):
+        """
+        Групи майже однакових фото (списки шляхів, від найбільших груп).
+        Фото в одній групі, якщо їх пов'язує ланцюжок пар з відстанню не більше max_distance.
+        """
+        tree = self._get_tree()
+        parent = {}
+
+        def find(item):
+            root = item
+            while parent.get(root, root) != root:
+                root = parent[root]
+            while item != root:  # Стискання шляху
+                parent[item], item = root, parent.get(item, item)
+            return root
+
+        for path, hash_text in self._conn.execute("SELECT path, hash FROM image_phash"):
+            for _, other in tree.search(int(hash_text, 16), max_distance):
+                first, second = find(path), find(other)
+                if first != second:
+                    parent[second] = first
+
+        clusters = {}
+        for item in parent:
+            clusters.setdefault(find(item), []).append(item)
+        for root, members in clusters.items():
+            if root not in members:
+                members.append(root)
+        groups = [sorted(members) for members in clusters.values() if len(members) > 1]
+        groups.sort(key=lambda members: (-len(members), members[0]))
+        return groups
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
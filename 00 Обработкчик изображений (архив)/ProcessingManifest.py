@@ -0,0 +1,138 @@
+"""
+Маніфест обробки папки: які файли вже оброблені і з якими параметрами.
+
+Маніфест лежить у самій папці (MANIFEST_FILENAME) у форматі JSON Lines:
+кожен оброблений файл дописує один рядок одразу після збереження, тому
+перерваний запуск втрачає щонайбільше недописаний останній рядок.
+При закритті файл стискається до останнього запису на кожен файл.
+Різні скрипти (pipeline) ведуть свої записи в тому самому файлі.
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_FILENAME = ".image_manifest.jsonl"
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-1 вмісту файлу (читається блоками)."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize_params(params):
+    """Приводить параметри до вигляду після JSON (кортежі -> списки), щоб їх можна було порівнювати."""
+    return json.loads(json.dumps(params, sort_keys=True))
+
+
+class ProcessingManifest:
+    """Записи про оброблені файли однієї папки: розмір, mtime, SHA-1 і параметри обробки."""
+
+    def __init__(self, folder_path, pipeline):
+        self.folder_path = folder_path
+        self.pipeline = pipeline
+        self.path = os.path.join(folder_path, MANIFEST_FILENAME)
+        self.entries = {}
+        self._file = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.entries[(entry['pipeline'], entry['name'])] = entry
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Недописаний рядок після перерваного запуску
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"  ! Не вдалося прочитати маніфест {self.path}: {e}")
+
+    def is_up_to_date(self, filename, params):
+        """
+        True, якщо файл не змінювався після обробки з тими самими параметрами.
+        Спочатку порівнюються розмір і mtime; якщо mtime змінився, а розмір ні,
+        перевіряється SHA-1 (файл могли просто скопіювати або "торкнутися").
+        """
+        entry = self.entries.get((self.pipeline, filename))
+        if entry is None or entry.get('params') != _normalize_params(params):
+            return False
+        try:
+            stat = os.stat(os.path.join(self.folder_path, filename))
+        except OSError:
+            return False
+        if stat.st_size != entry.get('size'):
+            return False
+        if stat.st_mtime_ns == entry.get('mtime_ns'):
+            return True
+        if file_digest(os.path.join(self.folder_path, filename)) != entry.get('sha1'):
+            return False
+        # Вміст той самий - оновлюємо mtime, щоб наступного разу не хешувати
+        self._append(dict(entry, mtime_ns=stat.st_mtime_ns))
+        return True
+
+    def record(self, filename, params):
+        """Записує стан щойно збереженого файлу (одразу на диск)."""
+        path = os.path.join(self.folder_path, filename)
+        try:
+            stat = os.stat(path)
+            entry = {
+                'pipeline': self.pipeline,
+                'name': filename,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'sha1': file_digest(path),
+                'params': _normalize_params(params),
+            }
+        except OSError as e:
+            print(f"  ! Не вдалося записати {filename} у маніфест: {e}")
+            return
+        self._append(entry)
+
+    def _append(self, entry):
+        self.entries[(entry['pipeline'], entry['name'])] = entry
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+        except OSError as e:
+            print(f"  ! Помилка запису маніфесту {self.path}: {e}")
+
+    def release(self):
+        """Закриває файл для дописування (без стискання); наступний запис відкриє його знову."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """Стискає маніфест: лишає по одному запису для файлів, що ще існують."""
+        self.release()
+        if not self.entries:
+            return
+        temp_path = self.path + ".tmp"
+        try:
+            existing = set(os.listdir(self.folder_path))
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for (_, name), entry in self.entries.items():
+                    if name in existing:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"  ! Не вдалося стиснути маніфест {self.path}: {e}")
+            # Недописаний тимчасовий файл не має лишатися в папці з фото
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
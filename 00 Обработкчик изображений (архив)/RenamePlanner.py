@@ -0,0 +1,207 @@
+"""
+Перейменування файлів папки за планом і з журналом.
+
+plan_renames отримує повну відповідність "старе ім'я -> нове ім'я" і будує
+послідовність os.rename: файли, чиє ім'я не змінюється, не чіпаються, ланцюжки
+(a -> b, b -> c) виконуються з кінця, а тимчасове ім'я потрібне лише одне на
+кожен цикл (a -> b, b -> a). Замість 2N мережевих викликів - N плюс кількість циклів.
+
+execute_plan спершу записує план у журнал (JOURNAL_FILENAME у самій папці), а
+після кожного перейменування дописує номер виконаного кроку. Якщо запуск
+перервався, recover_renames доводить план до кінця або відкочує виконані кроки.
+"""
+import json
+import os
+
+JOURNAL_FILENAME = ".rename_journal.jsonl"
+TEMP_PREFIX = "__rename_tmp_"
+
+
+def plan_renames(mapping, existing=()):
+    """
+    Повертає список кроків [(src, dst), ...] для перейменування за mapping {старе: нове}.
+
+    existing - усі імена в папці: тимчасові імена не збігатимуться з ними, а якщо
+    нове ім'я зайняте файлом, якого немає в mapping, кидається ValueError.
+    Імена порівнюються через os.path.normcase (на Windows - без урахування регістру).
+    """
+    pending = {src: dst for src, dst in mapping.items() if src != dst}
+    targets = {}
+    for src, dst in pending.items():
+        key = os.path.normcase(dst)
+        if key in targets:
+            raise ValueError(f"Два файли перейменовуються в одне ім'я: {targets[key]}, {src} -> {dst}")
+        targets[key] = src
+
+    # Імена, які не звільняться: сторонні файли і ті, що лишаються на місці
+    fixed = {os.path.normcase(name) for name in existing} | {os.path.normcase(name) for name in mapping}
+    fixed -= {os.path.normcase(src) for src in pending}
+    for dst in pending.values():
+        if os.path.normcase(dst) in fixed:
+            raise ValueError(f"Ім'я {dst} вже зайняте файлом, який не перейменовується")
+
+    sources = {os.path.normcase(src): src for src in pending}
+    taken = fixed | set(sources) | set(targets)
+
+    def blocker(src):
+        """Файл, що ще займає потрібне src нове ім'я (None, якщо ім'я вільне)."""
+        other = sources.get(os.path.normcase(pending[src]))
+        return other if other is not None and other != src else None
+
+    steps = []
+    # Хто чекає, поки звільниться ім'я: normcase(ім'я) -> src, якому воно потрібне
+    waiting = {}
+    ready = []
+    for src in pending:
+        other = blocker(src)
+        if other is None:
+            ready.append(src)
+        else:
+            waiting[os.path.normcase(other)] = src
+
+    temp_counter = 0
+    while pending:
+        while ready:
+            src = ready.pop()
+            dst = pending.pop(src)
+            del sources[os.path.normcase(src)]
+            steps.append((src, dst))
+            # Ім'я src звільнилось - файл, що на нього чекав, можна переносити
+            next_src = waiting.pop(os.path.normcase(src), None)
+            if next_src is not None:
+                ready.append(next_src)
+        if not pending:
+            break
+
+        # Лишились тільки цикли: один файл циклу відводимо на тимчасове ім'я
+        src = next(iter(pending))
+        while True:
+            temp_name = f"{TEMP_PREFIX}{temp_counter}_{src}"
+            temp_counter += 1
+            if os.path.normcase(temp_name) not in taken:
+                break
+        taken.add(os.path.normcase(temp_name))
+        steps.append((src, temp_name))
+        dst = pending.pop(src)
+        del sources[os.path.normcase(src)]
+        pending[temp_name] = dst
+        sources[os.path.normcase(temp_name)] = temp_name
+        # Хто чекав на ім'я src, тепер може рухатись; сам тимчасовий файл чекає далі по циклу
+        next_src = waiting.pop(os.path.normcase(src), None)
+        if next_src is not None:
+            ready.append(next_src)
+        other = blocker(temp_name)
+        if other is None:
+            ready.append(temp_name)
+        else:
+            waiting[os.path.normcase(other)] = temp_name
+    return steps
+
+
+def _journal_path(folder_path):
+    return os.path.join(folder_path, JOURNAL_FILENAME)
+
+
+def _rename(folder_path, src, dst):
+    os.rename(os.path.join(folder_path, src), os.path.join(folder_path, dst))
+    print(f"    - '{src}' -> '{dst}'")
+
+
+def _mark_done(journal, number):
+    """Дописує в журнал: кроки з номерами до number включно виконані."""
+    journal.write(json.dumps({'done': number}) + "\n")
+    journal.flush()
+
+
+def _run_steps(folder_path, steps, journal, start=0):
+    """Виконує кроки з номера start, після кожного дописує його номер у журнал."""
+    for number in range(start, len(steps)):
+        src, dst = steps[number]
+        _rename(folder_path, src, dst)
+        _mark_done(journal, number)
+
+
+def execute_plan(folder_path, steps):
+    """
+    Виконує кроки plan_renames у папці folder_path. Повертає True, якщо всі виконано.
+    При помилці друкує її і зупиняється: журнал лишається для recover_renames.
+    """
+    if not steps:
+        return True
+    journal_path = _journal_path(folder_path)
+    try:
+        with open(journal_path, 'w', encoding='utf-8') as journal:
+            journal.write(json.dumps({'plan': steps}, ensure_ascii=False) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())  # План має бути на диску до першого перейменування
+            _run_steps(folder_path, steps, journal)
+    except OSError as e:
+        print(f"  ! Помилка перейменування: {e}")
+        print(f"  ! План і виконані кроки збережено в {journal_path}; наступний запуск завершить перейменування.")
+        return False
+    os.remove(journal_path)
+    return True
+
+
+def _load_journal(journal_path):
+    """(кроки плану, кількість записаних виконаних кроків) або None, якщо журналу немає чи він пошкоджений."""
+    try:
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+    try:
+        steps = [tuple(step) for step in json.loads(lines[0])['plan']]
+    except (IndexError, ValueError, KeyError, TypeError):
+        return None
+    done = 0
+    for line in lines[1:]:
+        try:
+            done = json.loads(line)['done'] + 1
+        except (ValueError, KeyError, TypeError):
+            break  # Недописаний рядок
+    return steps, done
+
+
+def recover_renames(folder_path, roll_back=False):
+    """
+    Завершує перерване перейменування за журналом папки: за замовчуванням
+    виконує решту плану, при roll_back=True повертає виконані кроки назад.
+    Повертає False, якщо журналу не було, інакше True (журнал видаляється
+    лише після успішного відновлення).
+    """
+    journal_path = _journal_path(folder_path)
+    loaded = _load_journal(journal_path)
+    if loaded is None:
+        if os.path.exists(journal_path):
+            print(f"  ! Журнал перейменування {journal_path} пошкоджений, відновлення неможливе.")
+        return False
+    steps, done = loaded
+
+    def is_done(step):
+        src, dst = step
+        return not os.path.exists(os.path.join(folder_path, src)) and os.path.exists(os.path.join(folder_path, dst))
+
+    # Останній крок (вперед або при відкаті) міг виконатися, але не потрапити в журнал
+    if done < len(steps) and is_done(steps[done]):
+        done += 1
+    elif done > 0 and not is_done(steps[done - 1]):
+        done -= 1
+
+    print(f"  - Знайдено перерване перейменування: виконано {done} з {len(steps)} кроків.")
+    try:
+        with open(journal_path, 'a', encoding='utf-8') as journal:
+            if roll_back:
+                print("  - Відкат виконаних кроків...")
+                for number in reversed(range(done)):
+                    src, dst = steps[number]
+                    _rename(folder_path, dst, src)
+                    _mark_done(journal, number - 1)
+            else:
+                print("  - Завершення плану...")
+                _run_steps(folder_path, steps, journal, start=done)
+    except OSError as e:
+        print(f"  ! Помилка відновлення перейменування: {e}")
+        return True
+    os.remove(journal_path)
+    return True
@@ -0,0 +1,232 @@
+"""
+Обробка одного фото в квадрат 1500x1500 на білому фоні - спільна для скриптів
+перейменування і обробки папок, пакетної обробки артикулів і сервісу нових фото.
+
+render_file виконує кроки в пам'яті і повертає закодовані байти кожного
+розміру, write_file записує їх поруч з оригіналом, convert_file поєднує обидва
+кроки для пулу процесів. list_source_files і rename_to_article - вибір файлів
+папки і перейменування результатів в артикул.
+"""
+import os
+
+from natsort import natsorted
+
+from EncoderProfiles import DEFAULT_PROFILE, encode_image, get_profile, output_filename
+from ImageCore import (DERIVATIVE_SUFFIX, TILE_MEGAPIXELS, cascade_resize, crop_to_object, derivative_filename, fit_to_square,
+                       is_derivative_filename, is_normalized_square, open_for_square, pad_and_flatten, to_srgb)
+from ProcessingManifest import MANIFEST_FILENAME
+from RenamePlanner import JOURNAL_FILENAME, execute_plan, plan_renames
+from StageMetrics import current_metrics
+
+SERVICE_FILENAMES = (MANIFEST_FILENAME, JOURNAL_FILENAME)  # Службові файли в папках з фото - не джерела
+DEFAULT_OUTPUT_SIZES = [1500]
+
+
+def manifest_params(white_tolerance, padding_percent, draft_decode, profile=DEFAULT_PROFILE,
+                    output_sizes=(1500,), suffix=DERIVATIVE_SUFFIX):
+    """Параметри, з якими файл вважається обробленим; зміна будь-якого з них - обробка заново."""
+    params = {'white_tolerance': white_tolerance, 'padding_percent': padding_percent, 'draft_decode': draft_decode}
+    # Значення за замовчуванням не пишемо - старі маніфести лишаються дійсними
+    if profile != DEFAULT_PROFILE:
+        params['profile'] = profile
+    if list(output_sizes) != DEFAULT_OUTPUT_SIZES:
+        params['output_sizes'] = list(output_sizes)
+    if suffix != DERIVATIVE_SUFFIX:
+        params['suffix'] = suffix
+    return params
+
+
+def render_file(file, source, white_tolerance, padding_percent, draft_decode=False, profile=DEFAULT_PROFILE,
+                output_sizes=(1500,), tile_megapixels=TILE_MEGAPIXELS, skip_normalized=False, folder_path=None,
+                suffix=DERIVATIVE_SUFFIX):
+    """
+    Кроки 1-6 для одного файлу: source - шлях або файловий об'єкт.
+    Повертає {розмір: байти за профілем кодування} для кожного з output_sizes
+    (перший - основний файл) або None, якщо зображення порожнє.
+    folder_path і suffix потрібні skip_normalized: файл з похідними розмірами
+    пропускається, лише якщо всі похідні вже є в папці.
+    """
+    main_size = output_sizes[0]
+    metrics = current_metrics()
+    metrics.log(f"\nОбробка файлу: {file}")
+    if isinstance(source, str):
+        metrics.count('bytes_read', os.path.getsize(source))
+    # skip_normalized: файл уже main_size x main_size у форматі профілю з білими полями - не перекодовуємо ще раз
+    settings = get_profile(profile)
+    if skip_normalized and len(output_sizes) > 1:
+        skip_normalized = folder_path is not None and all(
+            os.path.isfile(os.path.join(folder_path, derivative_filename(file, size, suffix)))
+            for size in output_sizes[1:])
+    if skip_normalized and file.lower().endswith(settings['extension']):
+        with metrics.stage('check', file):
+            normalized = is_normalized_square(source, white_tolerance, padding_percent, main_size, settings['format'])
+        if normalized:
+            metrics.log(f"  - Вже нормалізований ({main_size}x{main_size}, білі поля {padding_percent}%). Пропуск.")
+            metrics.file_done(file, 'skipped', reason='normalized')
+            return None
+    # draft_decode: великі JPEG декодуються одразу зі зменшенням (1/2, 1/4, 1/8), якщо роздільності вистачає для основного розміру
+    with metrics.stage('decode', file):
+        img = open_for_square(source, white_tolerance, padding_percent, main_size, draft=draft_decode)
+        try:
+            img.load()
+        except Exception:
+            img.close()
+            raise
+    with img:
+        metrics.log(f"  - Початковий режим: {img.mode}, Розмір: {img.size}")
+
+        # 0. Вбудований колірний профіль (CMYK, Adobe RGB) -> sRGB і поворот за EXIF
+        with metrics.stage('colour', file):
+            img = to_srgb(img)
+
+        # 1-2. Межі об'єкта за маскою білого, обрізка і видалення фону лише в цій області
+        metrics.log(f"  - Крок 1-2: Пошук меж об'єкта та видалення білого фону (допуск {white_tolerance})...")
+        with metrics.stage('crop', file):
+            # Дуже великі кадри (TIFF, 16-бітні PNG) конвертуються і обрізаються смугами по tile_megapixels
+            img_cropped = crop_to_object(img, white_tolerance, tile_megapixels)
+
+        if img_cropped is None:
+            metrics.log("  ! Попередження: Зображення стало порожнім після видалення фону/обрізки. Пропуск.")
+            metrics.file_done(file, 'empty')
+            return None
+        metrics.log(f"  - Розмір після обрізки: {img_cropped.size}")
+
+        # 3-4. Поля і заміна прозорості на білий за один прохід
+        metrics.log(f"  - Крок 3-4: Додавання полів ({padding_percent}%) і конвертація в RGB на білому фоні...")
+        with metrics.stage('pad', file):
+            img = pad_and_flatten(img_cropped, padding_percent)
+        metrics.log(f"  - Розмір перед масштабуванням: {img.size}")
+
+        # 5. Зміна розміру до основного квадрата з центровкою
+        metrics.log(f"  - Крок 5: Масштабування до {main_size}x{main_size} з центровкою...")
+        with metrics.stage('resize', file):
+            img = fit_to_square(img, main_size)
+
+        # 6. Кодування за профілем (запис на диск - окремо, у write_file)
+        metrics.log(f"  - Крок 6: Збереження як {output_filename(file, profile)} (профіль {profile})...")
+        with metrics.stage('encode', file):
+            outputs = {main_size: encode_image(img, profile)}
+
+        # 6a. Похідні розміри - каскадом з готового квадрата в пам'яті, без повторного декодування
+        if len(output_sizes) > 1:
+            metrics.log(f"  - Крок 6a: Похідні розміри {', '.join(str(size) for size in output_sizes[1:])}...")
+            with metrics.stage('derivatives', file):
+                for size, derivative in cascade_resize(img, output_sizes[1:]):
+                    outputs[size] = encode_image(derivative, profile)
+        return outputs
+
+
+def write_file(folder_path, file, outputs, profile=DEFAULT_PROFILE, suffix=DERIVATIVE_SUFFIX):
+    """Записує готовий файл поруч з оригіналом і видаляє оригінал, якщо потрібно. Повертає ім'я збереженого файлу."""
+    file_path = os.path.join(folder_path, file)
+    # Визначаємо нове ім'я файлу (розширення - з профілю кодування)
+    extension = get_profile(profile)['extension']
+    new_filename = output_filename(file, profile)
+    new_file_path = os.path.join(folder_path, new_filename)
+    metrics = current_metrics()
+    with metrics.stage('write', file):
+        for number, (size, image_data) in enumerate(outputs.items()):
+            # Перший розмір - основний файл, решта - похідні з суфіксом
+            path = new_file_path if number == 0 else derivative_filename(new_file_path, size, suffix)
+            with open(path, 'wb') as f:
+                f.write(image_data)
+            metrics.count('bytes_written', len(image_data))
+
+    # 7. Видалення вихідного файлу, якщо це не був файл того ж формату з тим самим іменем
+    # Перевіряємо, чи відрізняється оригінальний шлях від нового шляху
+    # І чи оригінал мав інше розширення
+    if file_path.lower() != new_file_path.lower() and not file.lower().endswith(extension):
+        try:
+            metrics.log(f"  - Видалення оригінального файлу: {file}")
+            os.remove(file_path)
+        except Exception as remove_error:
+            print(f"  ! Помилка при видаленні {file}: {remove_error}")
+    elif file_path.lower() == new_file_path.lower():
+        metrics.log(f"  - Оригінальний файл був {extension} і був перезаписаний.")
+    # Випадок, коли оригінал мав те саме розширення, але інший регістр
+    elif file_path.lower() != new_file_path.lower() and file.lower().endswith(extension):
+         # Це може статись, якщо регістр літер відрізнявся.
+         # Ми вже перезаписали файл, тому видаляти не треба.
+         metrics.log(f"  - Оригінальний файл {file} перезаписаний як {new_filename}.")
+         pass
+
+    metrics.file_done(file, 'ok')
+    return new_filename
+
+
+def convert_file(folder_path, file, white_tolerance, padding_percent, draft_decode=False, profile=DEFAULT_PROFILE,
+                 output_sizes=(1500,), suffix=DERIVATIVE_SUFFIX, tile_megapixels=TILE_MEGAPIXELS, skip_normalized=False):
+    """Обробляє один файл папки і зберігає його як 1500x1500 з тим самим ім'ям за профілем кодування. Повертає ім'я збереженого файлу або False."""
+    try:
+        outputs = render_file(file, os.path.join(folder_path, file), white_tolerance, padding_percent, draft_decode,
+                              profile, output_sizes, tile_megapixels, skip_normalized, folder_path, suffix)
+        if outputs is None:
+            return False
+        return write_file(folder_path, file, outputs, profile, suffix)
+
+    except Exception as e:
+        print(f"!!! Помилка обробки файлу {file}: {e}")
+        import traceback
+        traceback.print_exc()
+        current_metrics().file_done(file, 'failed', error=str(e))
+        return False
+
+
+def list_source_files(folder_path, output_sizes=(1500,), suffix=DERIVATIVE_SUFFIX):
+    """Файли папки для обробки в природному порядку (без службових файлів і похідних розмірів)."""
+    # Похідні розміри попередніх запусків (photo_800px.jpg) і службові файли разом з їх
+    # тимчасовими копіями (.image_manifest.jsonl.tmp) - не джерела
+    return natsorted([f for f in os.listdir(folder_path)
+                      if os.path.isfile(os.path.join(folder_path, f)) and not f.startswith(SERVICE_FILENAMES)
+                      and not is_derivative_filename(f, output_sizes[1:], suffix)])
+
+
+def rename_to_article(folder_path, article_name, profile=DEFAULT_PROFILE, output_sizes=(1500,), suffix=DERIVATIVE_SUFFIX):
+    """Перейменовує оброблені файли папки в article_name, article_name_1, ... Повертає True, якщо перейменування виконано."""
+    print("Перейменування файлів...")
+
+    # Оновлюємо список файлів ТІЛЬКИ у форматі результату після всіх перетворень
+    extension = get_profile(profile)['extension']
+    try:
+        folder_files = set(os.listdir(folder_path))
+        current_files = natsorted([f for f in folder_files if f.lower().endswith(extension) and os.path.isfile(os.path.join(folder_path, f))
+                                   and not is_derivative_filename(f, output_sizes[1:], suffix)])
+        print(f"Файлів для перейменування ({extension}): {len(current_files)}")
+    except Exception as e:
+         print(f"Помилка при отриманні списку {extension} файлів для перейменування: {e}")
+         return False
+
+    if not current_files:
+        print(f"Папка не містить {extension} файлів після обробки. Перейменування неможливе.")
+        return False
+
+    exact_match_filename = f"{article_name}{extension}"
+    # Повна відповідність старих і нових імен: файл з точною назвою артикулу лишається,
+    # решта нумеруються в природному порядку
+    rename_map = {}
+    final_rename_counter = 1
+    for filename in current_files:
+        if filename == exact_match_filename:
+            rename_map[filename] = filename
+        else:
+            rename_map[filename] = f"{article_name}_{final_rename_counter}{extension}"
+            final_rename_counter += 1
+        # Похідні розміри перейменовуються разом з основним файлом
+        for size in output_sizes[1:]:
+            derivative = derivative_filename(filename, size, suffix)
+            if derivative in folder_files:
+                rename_map[derivative] = derivative_filename(rename_map[filename], size, suffix)
+
+    print("  - Планування перейменувань...")
+    try:
+        steps = plan_renames(rename_map, folder_files)
+    except ValueError as plan_error:
+        print(f"  ! Перейменування неможливе: {plan_error}")
+        return False
+    print(f"  - Перейменувань: {len(steps)} (файлів з новими іменами: "
+          f"{sum(1 for old, new in rename_map.items() if old != new)})")
+    if not execute_plan(folder_path, steps):
+        return False
+
+    print("Перейменування завершено.")
+    return True
@@ -0,0 +1,138 @@
+"""
+Заміри етапів пофайлової обробки замість покрокового друку.
+
+Скрипт створює StageMetrics і робить його поточним (set_metrics); функції
+обробки беруть його через current_metrics() і обгортають етапи в
+`with metrics.stage('decode', file):`. Кожен замір і результат файлу
+потрапляє в лічильники, а якщо задано events_path - ще й рядком у файл
+JSON Lines. summary() друкує p50/p95 кожного етапу і лічильники.
+
+У quiet-режимі log() нічого не друкує: на консолі Windows/RDP друк тисяч
+рядків помітно сповільнює пакет. Помилки друкуються завжди.
+
+Для пулу процесів (BatchRunner.run_tasks) воркер збирає події в пам'ять
+(collect=True), а батьківський процес додає їх до свого StageMetrics через merge().
+"""
+import json
+import math
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+FILE_STATUSES = ('ok', 'empty', 'skipped', 'failed')
+
+
+def percentile(values, percent):
+    """Перцентиль за найближчим рангом (values не обов'язково відсортовані)."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class StageMetrics:
+    """Час етапів, лічильники файлів і байтів, журнал подій."""
+
+    def __init__(self, events_path=None, quiet=False, collect=False):
+        self.quiet = quiet
+        self.events_path = events_path
+        self.timings = {}   # етап -> [секунди, ...]
+        self.counters = {}  # 'ok', 'failed', 'bytes_read', ... -> число
+        self._collected = [] if collect else None
+        self._events_file = open(events_path, 'a', encoding='utf-8') if events_path else None
+        self._lock = threading.Lock()  # Етапи конвеєра викликаються з різних потоків
+
+    def log(self, message):
+        """Друк покрокових повідомлень (вимикається в quiet-режимі)."""
+        if not self.quiet:
+            print(message)
+
+    def _emit(self, event):
+        if self._collected is not None:
+            self._collected.append(event)
+        if self._events_file is not None:
+            self._events_file.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def _apply(self, event):
+        """Додає подію до лічильників (викликається під блокуванням)."""
+        kind = event['event']
+        if kind == 'stage':
+            self.timings.setdefault(event['stage'], []).append(event['seconds'])
+        elif kind == 'file':
+            self.counters[event['status']] = self.counters.get(event['status'], 0) + 1
+        elif kind == 'count':
+            self.counters[event['name']] = self.counters.get(event['name'], 0) + event['value']
+        self._emit(event)
+
+    def _record(self, event):
+        event['t'] = round(time.time(), 3)
+        with self._lock:
+            self._apply(event)
+
+    @contextmanager
+    def stage(self, name, file=None):
+        """Міряє час блоку як етап name (для файлу file)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record({'event': 'stage', 'stage': name, 'file': file,
+                          'seconds': round(time.perf_counter() - start, 6)})
+
+    def count(self, name, value=1, file=None):
+        """Додає value до лічильника name (байти, пропущені файли тощо)."""
+        self._record({'event': 'count', 'name': name, 'value': value, 'file': file})
+
+    def file_done(self, file, status, **details):
+        """Результат обробки файлу: один з FILE_STATUSES."""
+        self._record(dict({'event': 'file', 'file': file, 'status': status}, **details))
+
+    def drain(self):
+        """Забирає зібрані події (collect=True) - для передачі з воркера."""
+        with self._lock:
+            events, self._collected = self._collected or [], []
+        return events
+
+    def merge(self, events):
+        """Додає події, зібрані в іншому процесі."""
+        with self._lock:
+            for event in events:
+                self._apply(event)
+
+    def summary(self):
+        """Друкує p50/p95 і сумарний час кожного етапу та лічильники."""
+        if self.timings:
+            print(f"\n{'Етап':<12} | {'Файлів':>6} | {'p50, мс':>8} | {'p95, мс':>8} | {'Разом, с':>8}")
+            print("-" * 54)
+            for name, values in self.timings.items():
+                print(f"{name:<12} | {len(values):>6} | {statistics.median(values) * 1000:>8.1f} | "
+                      f"{percentile(values, 95) * 1000:>8.1f} | {sum(values):>8.1f}")
+        if self.counters:
+            files = ", ".join(f"{status}: {self.counters[status]}" for status in FILE_STATUSES if status in self.counters)
+            if files:
+                print(f"Файли - {files}")
+            for name in ('bytes_read', 'bytes_written'):
+                if name in self.counters:
+                    print(f"{name}: {self.counters[name] / (1024 * 1024):.1f} МБ")
+        if self.events_path:
+            print(f"Журнал подій: {self.events_path}")
+
+    def close(self):
+        if self._events_file is not None:
+            self._events_file.close()
+            self._events_file = None
+
+
+_current = StageMetrics()
+
+
+def current_metrics():
+    """Поточний StageMetrics процесу (за замовчуванням - без журналу, з друком)."""
+    return _current
+
+
+def set_metrics(metrics):
+    """Робить metrics поточним і повертає попередній."""
+    global _current
+    previous, _current = _current, metrics
+    return previous
@@ -0,0 +1,98 @@
+"""
+Спільні картинки в пакеті xlsx.
+
+openpyxl записує окремий файл xl/media/imageN для кожного вставленого
+зображення, навіть якщо це той самий артикул у десяти рядках чи на кількох
+аркушах. deduplicate_media після збереження книги залишає одну копію кожного
+однакового (байт у байт) зображення і переводить на неї посилання всіх
+малюнків (файли .rels), тож розмір книги залежить від кількості унікальних
+картинок, а не рядків.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import zipfile
+
+MEDIA_PREFIX = "xl/media/"
+
+_TARGET_RE = re.compile(r'Target="([^"]+)"')
+_OVERRIDE_RE = re.compile(r'<Override PartName="/([^"]+)"[^>]*/>')
+
+
+def _rels_source_dir(rels_name):
+    """Папка частини, якій належить файл зв'язків: xl/drawings/_rels/drawing1.xml.rels -> xl/drawings."""
+    return posixpath.dirname(posixpath.dirname(rels_name))
+
+
+def _remove_quietly(path):
+    """Прибирає недописану тимчасову копію, щоб вона не лишалася поруч із книгою."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def deduplicate_media(xlsx_path):
+    """
+    Видаляє з xlsx повтори однакових файлів xl/media і перенаправляє на першу копію
+    всі посилання. Книга перезаписується через тимчасовий файл поруч.
+    Повертає (видалено файлів, заощаджено байтів).
+    """
+    with zipfile.ZipFile(xlsx_path) as archive:
+        infos = archive.infolist()
+        canonical = {}   # sha1 -> перша частина з таким вмістом
+        duplicates = {}  # частина-повтор -> перша частина
+        saved = 0
+        for info in infos:
+            if not info.filename.startswith(MEDIA_PREFIX):
+                continue
+            digest = hashlib.sha1(archive.read(info)).hexdigest()
+            first = canonical.setdefault(digest, info.filename)
+            if first != info.filename:
+                duplicates[info.filename] = first
+                saved += info.compress_size
+        if not duplicates:
+            return 0, 0
+
+        temp_path = xlsx_path + ".tmp"
+        try:
+            with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as output:
+                for info in infos:
+                    if info.filename in duplicates:
+                        continue
+                    data = archive.read(info)
+                    if info.filename.endswith(".rels"):
+                        source_dir = _rels_source_dir(info.filename)
+
+                        def retarget(match):
+                            # openpyxl пише абсолютні шляхи (/xl/media/...), Excel - відносні (../media/...)
+                            target = match.group(1)
+                            if target.startswith('/'):
+                                part = posixpath.normpath(target[1:])
+                                if part in duplicates:
+                                    return f'Target="/{duplicates[part]}"'
+                            else:
+                                part = posixpath.normpath(posixpath.join(source_dir, target))
+                                if part in duplicates:
+                                    return f'Target="{posixpath.relpath(duplicates[part], source_dir)}"'
+                            return match.group(0)
+
+                        data = _TARGET_RE.sub(retarget, data.decode('utf-8')).encode('utf-8')
+                    elif info.filename == "[Content_Types].xml":
+                        data = _OVERRIDE_RE.sub(lambda match: "" if match.group(1) in duplicates else match.group(0),
+                                                data.decode('utf-8')).encode('utf-8')
+                    # Новий ZipInfo: writestr змінює зсув переданого запису, а записи вхідного архіву ще читаються
+                    entry = zipfile.ZipInfo(info.filename, info.date_time)
+                    entry.compress_type = info.compress_type
+                    entry.external_attr = info.external_attr
+                    output.writestr(entry, data)
+        except BaseException:
+            _remove_quietly(temp_path)
+            raise
+    try:
+        os.replace(temp_path, xlsx_path)
+    except BaseException:
+        _remove_quietly(temp_path)
+        raise
+    return len(duplicates), saved
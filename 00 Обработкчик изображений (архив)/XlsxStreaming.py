@@ -0,0 +1,245 @@
+"""
+Потокове копіювання аркушів xlsx: читання openpyxl у режимі read_only,
+запис xlsxwriter у режимі constant_memory.
+
+openpyxl.load_workbook тримає в пам'яті всі клітинки (а вставлені картинки -
+до wb.save), тож на аркушах у десятки тисяч рядків пам'ять і час збереження
+ростуть разом з розміром. Тут рядки читаються і записуються по одному:
+iter_sheet_rows віддає рядок разом з його висотою і шириною колонок,
+SheetCopier переносить значення, числові формати, ширину колонок і висоту
+рядків. Інше оформлення (шрифти, заливка, об'єднані клітинки) не переноситься.
+
+xlsxwriter - необов'язкова залежність: імпортується лише при створенні книги.
+
+Модуль спирається на внутрішні (приватні) частини обох бібліотек: парсер
+аркуша і таблиці стилів книги openpyxl, розрахунок положення картинок
+xlsxwriter. Вони перевірені з версіями TESTED_VERSIONS; open_streaming_workbook
+перед записом перевіряє, що все потрібне є, і інакше кидає RuntimeError.
+"""
+import datetime
+import inspect
+
+import openpyxl
+from openpyxl.styles.numbers import BUILTIN_FORMATS, BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.utils import column_index_from_string
+from openpyxl.worksheet.formula import ArrayFormula
+
+try:
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:  # Внутрішній модуль openpyxl: про відсутність повідомить open_streaming_workbook
+    WorkSheetParser = None
+
+DEFAULT_COLUMN_WIDTH = 13.0  # Те саме, що openpyxl повертає для колонки без <col>
+COLUMN_WIDTH_PX = 7          # Пікселів на одиницю ширини колонки Excel (шрифт Calibri 11)
+TESTED_VERSIONS = {'openpyxl': '3.1.5', 'xlsxwriter': '3.2.9'}
+
+# Внутрішні атрибути, які використовують iter_sheet_rows і SheetCopier
+_WORKSHEET_PARSER_PARAMS = ('src', 'shared_strings', 'data_only', 'epoch', 'date_formats', 'timedelta_formats')
+_SOURCE_WORKBOOK_ATTRS = ('_cell_styles', '_number_formats', '_date_formats', '_timedelta_formats')
+_SOURCE_WORKSHEET_ATTRS = ('_get_source', '_shared_strings')
+_POSITION_PARAMS = ('col_start', 'row_start', 'x1', 'y1', 'width', 'height', 'anchor')
+
+
+_worksheet_class = None
+
+
+def _streaming_worksheet_class():
+    """
+    Аркуш xlsxwriter з кешем зсувів рядків. Для кожної картинки xlsxwriter
+    підсумовує висоти всіх рядків над нею (якщо висоти змінювались), тож на
+    десятках тисяч рядків з картинками збереження стає квадратичним. Положення
+    картинок рахуються при закритті книги, коли всі рядки вже записані, тому
+    накопичені суми рахуються один раз.
+    """
+    global _worksheet_class
+    if _worksheet_class is None:
+        from xlsxwriter.worksheet import Worksheet
+
+        class StreamingWorksheet(Worksheet):
+            _row_offsets = None
+
+            def _row_offset(self, row):
+                """Відстань у пікселях від верху аркуша до рядка row."""
+                offsets = self._row_offsets
+                if offsets is None:
+                    offsets = self._row_offsets = [0]
+                while len(offsets) <= row:
+                    offsets.append(offsets[-1] + self._size_row(len(offsets) - 1))
+                return offsets[row]
+
+            def _position_object_pixels(self, *args):
+                if not self.row_size_changed:
+                    return super()._position_object_pixels(*args)
+                # Без прапорця xlsxwriter рахує y_abs за висотою рядка за замовчуванням; справжній
+                # зсув - верх рядка row_start плюс відступ y1 у ньому (vertices[1] і vertices[3])
+                self.row_size_changed = False
+                try:
+                    vertices = super()._position_object_pixels(*args)
+                finally:
+                    self.row_size_changed = True
+                vertices[9] = self._row_offset(vertices[1]) + vertices[3]
+                return vertices
+
+        _worksheet_class = StreamingWorksheet
+    return _worksheet_class
+
+
+def _missing_internals(source_workbook=None):
+    """Список внутрішніх частин openpyxl і xlsxwriter, яких бракує або які змінилися."""
+    from xlsxwriter.worksheet import Worksheet
+
+    missing = []
+    if WorkSheetParser is None:
+        missing.append("openpyxl.worksheet._reader.WorkSheetParser")
+    elif not set(_WORKSHEET_PARSER_PARAMS) <= set(inspect.signature(WorkSheetParser).parameters):
+        missing.append("параметри WorkSheetParser")
+    if source_workbook is not None:
+        missing.extend(f"Workbook.{name}" for name in _SOURCE_WORKBOOK_ATTRS if not hasattr(source_workbook, name))
+        if source_workbook.worksheets:
+            worksheet = source_workbook.worksheets[0]
+            missing.extend(f"{type(worksheet).__name__}.{name}" for name in _SOURCE_WORKSHEET_ATTRS
+                           if not hasattr(worksheet, name))
+    position = getattr(Worksheet, '_position_object_pixels', None)
+    if position is None or tuple(inspect.signature(position).parameters)[1:] != _POSITION_PARAMS:
+        missing.append("xlsxwriter Worksheet._position_object_pixels")
+    else:
+        # Перевизначення змінює y_abs - десятий елемент результату
+        worksheet = Worksheet()
+        if not hasattr(worksheet, 'row_size_changed') or not hasattr(worksheet, '_size_row') or len(
+                worksheet._position_object_pixels(0, 0, 0, 0, 1, 1, 1)) != 10:
+            missing.append("xlsxwriter Worksheet.row_size_changed, _size_row або результат _position_object_pixels")
+    return missing
+
+
+def open_streaming_workbook(path, source_workbook=None):
+    """
+    Нова книга xlsxwriter у режимі constant_memory (рядки пишуться на диск одразу).
+    Спершу перевіряє внутрішні частини бібліотек, на які спирається модуль (з
+    source_workbook - і атрибути книги, відкритої openpyxl з read_only=True).
+    """
+    try:
+        import xlsxwriter
+    except ImportError:
+        raise ImportError("Для потокового запису потрібен пакет xlsxwriter: pip install xlsxwriter")
+    missing = _missing_internals(source_workbook)
+    if missing:
+        raise RuntimeError(
+            f"Потоковий запис перевірено з openpyxl {TESTED_VERSIONS['openpyxl']} і xlsxwriter "
+            f"{TESTED_VERSIONS['xlsxwriter']}, встановлено openpyxl {openpyxl.__version__} і xlsxwriter "
+            f"{xlsxwriter.__version__}; змінилися: {', '.join(missing)}")
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    workbook.worksheet_class = _streaming_worksheet_class()
+    return workbook
+
+
+def iter_sheet_rows(ws, columns=None):
+    """
+    Генерує (номер рядка, атрибути рядка, клітинки, колонки) аркуша ws, відкритого з read_only=True.
+    Атрибути рядка - словник з XML (ht, hidden, ...), клітинки - словники парсера openpyxl
+    (column, value, data_type, style_id), колонки - {літера: атрибути <col>}; вони стоять
+    у файлі перед даними, тож уже повні на першому рядку. Аркуш без рядків нічого не
+    віддає, тому в переданий словник columns після читання аркуша записуються його колонки.
+    """
+    # Той самий парсер, що й у ReadOnlyWorksheet, але з доступом до висоти рядків і ширини колонок
+    wb = ws.parent
+    with ws._get_source() as source:
+        parser = WorkSheetParser(source, ws._shared_strings, data_only=wb.data_only, epoch=wb.epoch,
+                                 date_formats=wb._date_formats, timedelta_formats=wb._timedelta_formats)
+        for row_index, cells in parser.parse():
+            # Атрибути рядка забираємо одразу, щоб словник парсера не ріс з кожним рядком
+            yield row_index, parser.row_dimensions.pop(str(row_index), {}), cells, parser.column_dimensions
+        if columns is not None:
+            columns.update(parser.column_dimensions)
+
+
+def column_width(columns, column):
+    """Ширина колонки (літера) з атрибутів <col>; DEFAULT_COLUMN_WIDTH, якщо не задана."""
+    index = column_index_from_string(column)
+    for attrs in columns.values():
+        if int(attrs['min']) <= index <= int(attrs.get('max', attrs['min'])) and 'width' in attrs:
+            return float(attrs['width'])
+    return DEFAULT_COLUMN_WIDTH
+
+
+def _is_true(value):
+    return value in ('1', 'true')
+
+
+class SheetCopier:
+    """Переносить рядки аркуша read_only у аркуш xlsxwriter (constant_memory - строго по порядку)."""
+
+    def __init__(self, source_ws, target_workbook, title=None):
+        self.source_wb = source_ws.parent
+        self.target_workbook = target_workbook
+        self.target = target_workbook.add_worksheet(title or source_ws.title)
+        self._formats = {}         # рядок числового формату -> формат xlsxwriter
+        self._columns_set = False
+
+    def _cell_format(self, style_id):
+        """Формат xlsxwriter з числовим форматом клітинки (None для General)."""
+        if not style_id:
+            return None
+        try:
+            format_id = self.source_wb._cell_styles[style_id].numFmtId
+        except IndexError:
+            return None
+        if format_id < BUILTIN_FORMATS_MAX_SIZE:
+            number_format = BUILTIN_FORMATS.get(format_id, 'General')
+        else:
+            number_format = self.source_wb._number_formats[format_id - BUILTIN_FORMATS_MAX_SIZE]
+        if number_format == 'General':
+            return None
+        if number_format not in self._formats:
+            self._formats[number_format] = self.target_workbook.add_format({'num_format': number_format})
+        return self._formats[number_format]
+
+    def set_columns(self, columns):
+        """Ширина і прихованість колонок (у constant_memory - до першого рядка)."""
+        for attrs in columns.values():
+            first = int(attrs['min']) - 1
+            last = int(attrs.get('max', attrs['min'])) - 1
+            options = {'hidden': True} if _is_true(attrs.get('hidden')) else None
+            if 'width' in attrs:
+                # Через пікселі: set_column додає до ширини відступ, а в XML він уже врахований
+                self.target.set_column_pixels(first, last, round(float(attrs['width']) * COLUMN_WIDTH_PX),
+                                              None, options)
+            elif options:
+                self.target.set_column(first, last, None, None, options)
+
+    def finish(self, columns):
+        """Колонки аркуша, в який не записано жодного рядка (інакше їх задає write_row)."""
+        if not self._columns_set:
+            self.set_columns(columns)
+            self._columns_set = True
+
+    def write_row(self, row_index, row_attrs, cells, columns):
+        """Записує рядок (номер з 1, як у Excel) з його висотою і значеннями клітинок."""
+        if not self._columns_set:
+            self.set_columns(columns)
+            self._columns_set = True
+        row = row_index - 1
+        if 'ht' in row_attrs or _is_true(row_attrs.get('hidden')):
+            height = float(row_attrs['ht']) if 'ht' in row_attrs else None
+            self.target.set_row(row, height, None, {'hidden': _is_true(row_attrs.get('hidden'))})
+        for cell in cells:
+            value = cell['value']
+            if value is None:
+                continue
+            column = cell['column'] - 1
+            cell_format = self._cell_format(cell['style_id'])
+            data_type = cell['data_type']
+            if data_type == 'f':
+                if isinstance(value, ArrayFormula):
+                    self.target.write_array_formula(value.ref, value.text, cell_format)
+                else:
+                    self.target.write_formula(row, column, str(value), cell_format)
+            elif data_type == 'n':
+                self.target.write_number(row, column, value, cell_format)
+            elif data_type == 'b':
+                self.target.write_boolean(row, column, bool(value), cell_format)
+            elif data_type == 'd' and isinstance(value, (datetime.datetime, datetime.date, datetime.time,
+                                                         datetime.timedelta)):
+                self.target.write_datetime(row, column, value, cell_format)
+            else:
+                # Текст, помилки (#N/A) і дати, які не вдалося розібрати, - як є, без розбору формул
+                self.target.write_string(row, column, str(value), cell_format)
@@ -0,0 +1,119 @@
+import os
+
+from DropFolderWatcher import DropFolderWatcher, serve
+from EncoderProfiles import DEFAULT_PROFILE, get_profile
+from ImageCore import DERIVATIVE_SUFFIX, TILE_MEGAPIXELS, derivative_filename, is_derivative_filename
+from ProcessingManifest import ProcessingManifest
+from SquarePipeline import SERVICE_FILENAMES, convert_file, manifest_params
+from StageMetrics import StageMetrics, set_metrics
+
+# --- Константи ---
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff', '.gif'}
+# --- ---
+
+
+def watch_drop_folders(drop_folders, white_tolerance, padding_percent, workers=2, queue_size=32, settle_seconds=5.0,
+                       poll_interval=2.0, status_interval=60.0, status_path=None, draft_decode=True, quiet=True,
+                       events_path=None, profile=DEFAULT_PROFILE, output_sizes=(1500,), suffix=DERIVATIVE_SUFFIX,
+                       tile_megapixels=TILE_MEGAPIXELS):
+    try:
+        get_profile(profile)
+    except ValueError as e:
+        print(f"Помилка: {e}")
+        return
+    output_sizes = list(output_sizes)
+    if not output_sizes or output_sizes != sorted(output_sizes, reverse=True):
+        print(f"Помилка: розміри результату мають іти за спаданням (основний - перший): {output_sizes}")
+        return
+    print(f"Допуск для білого фону: {white_tolerance}, поля: {padding_percent}%, профіль кодування: {profile}")
+
+    # Ті самі параметри, що й у скрипті 1500: маніфест папки спільний, тож уже оброблені файли не чіпаються
+    params = manifest_params(white_tolerance, padding_percent, draft_decode, profile, output_sizes, suffix)
+    manifests = {}
+
+    def get_manifest(folder):
+        if folder not in manifests:
+            manifests[folder] = ProcessingManifest(folder, 'square_1500')
+        return manifests[folder]
+
+    def accept(folder, name):
+        """Чи брати файл у роботу: лише зображення, не службові файли і не похідні розміри."""
+        if name.startswith(('.', '~$')) or name in SERVICE_FILENAMES:
+            return False
+        if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+            return False
+        if is_derivative_filename(name, output_sizes[1:], suffix):
+            return False
+        return not get_manifest(folder).is_up_to_date(name, params)
+
+    def on_result(folder, name, new_filename):
+        """Записує результат у маніфест і повертає імена записаних файлів."""
+        if not new_filename:
+            return []
+        get_manifest(folder).record(new_filename, params)
+        return [new_filename] + [derivative_filename(new_filename, size, suffix) for size in output_sizes[1:]]
+
+    def make_args(folder, name):
+        return (folder, name, white_tolerance, padding_percent, draft_decode, profile, output_sizes, suffix,
+                tile_megapixels)
+
+    watcher = DropFolderWatcher(drop_folders, accept, settle_seconds)
+    # quiet: без покрокового друку кожного файлу; events_path - заміри етапів у JSON Lines
+    metrics = StageMetrics(events_path, quiet)
+    previous_metrics = set_metrics(metrics)
+    try:
+        serve(watcher, convert_file, make_args, on_result, workers=workers, queue_size=queue_size,
+              poll_interval=poll_interval, status_interval=status_interval, status_path=status_path)
+        metrics.summary()
+    finally:
+        for manifest in manifests.values():
+            manifest.close()
+        set_metrics(previous_metrics)
+        metrics.close()
+
+
+if __name__ == "__main__":
+    # --- Налаштування користувача ---
+    drop_folders = [                      # !!! Папки, куди приходять нові фото
+        r"\\10.10.100.2\Foto\KIDS TEAM",
+    ]
+    tolerance_for_white = 0               # !!! Допуск для білого (0-255)
+    padding_percentage = 5                # !!! Відсоток полів (наприклад, 5 для 5%)
+    workers_count = 2                     # !!! Кількість процесів обробки
+    queue_size = 32                       # !!! Скільки готових файлів може чекати в черзі (далі папки не опитуються)
+    settle_seconds = 5                    # !!! Скільки секунд розмір файлу не має змінюватись, щоб вважати його дописаним
+    poll_interval = 2                     # !!! Як часто опитувати папки (секунди)
+    status_interval = 60                  # !!! Як часто друкувати глибину черги і швидкість (секунди)
+    status_file = None                    # !!! Файл JSON зі станом сервісу для моніторингу (None - не писати)
+    use_draft_decode = True               # !!! Зменшене декодування великих JPEG (False - завжди повний розмір)
+    quiet_mode = True                     # !!! False - друкувати кроки обробки кожного файлу
+    events_log_path = None                # !!! Файл JSON Lines із замірами етапів кожного файлу (None - не писати)
+    encoder_profile = "archive"           # !!! Профіль кодування: fast, balanced, archive (JPEG q95 як раніше), webp, avif
+    output_sizes = [1500]                 # !!! Розміри результату за спаданням, наприклад [1500, 800, 300]; перший - основний файл
+    derivative_suffix = "_{size}px"       # !!! Правило імені похідних: photo.jpg -> photo_800px.jpg (не "_{size}" - так нумеруються артикули)
+    tile_megapixels = 24                  # !!! Кадри, більші за стільки мегапікселів, обрізаються смугами (None - без смуг)
+    # --- ---
+
+    missing = [folder for folder in drop_folders if not os.path.isdir(folder)]
+    if missing:
+        print(f"Помилка: папки не існують або недоступні: {', '.join(missing)}")
+    else:
+        watch_drop_folders(
+            drop_folders,
+            tolerance_for_white,
+            padding_percentage,
+            workers=workers_count,
+            queue_size=queue_size,
+            settle_seconds=settle_seconds,
+            poll_interval=poll_interval,
+            status_interval=status_interval,
+            status_path=status_file,
+            draft_decode=use_draft_decode,
+            quiet=quiet_mode,
+            events_path=events_log_path,
+            profile=encoder_profile,
+            output_sizes=output_sizes,
+            suffix=derivative_suffix,
+            tile_megapixels=tile_megapixels
+        )
+        print("\nСервіс зупинено.")
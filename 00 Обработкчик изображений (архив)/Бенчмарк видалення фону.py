@@ -0,0 +1,77 @@
+import random
+import time
+from PIL import Image, ImageDraw
+
+from ImageCore import remove_white_background
+
+# --- Налаштування ---
+IMAGE_SIZES = [(800, 800), (2000, 2000), (4000, 4000)]  # Розміри синтетичних фото
+TOLERANCE = 10                                           # Допуск для білого (0-255)
+LEGACY_MAX_PIXELS = 4_000_000  # Старий цикл повільний - на більших розмірах його пропускаємо
+# --- ---
+
+
+def legacy_remove_white_background(img, tolerance):
+    """Попередня реалізація (цикл по getdata) - еталон для порівняння."""
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    datas = img.getdata()
+    newData = []
+    cutoff = 255 - tolerance
+    for item in datas:
+        if item[0] >= cutoff and item[1] >= cutoff and item[2] >= cutoff:
+            newData.append((item[0], item[1], item[2], 0))
+        else:
+            newData.append(item)
+    img.putdata(newData)
+    return img
+
+
+def make_product_photo(size, seed=0):
+    """Синтетичне "фото товару": майже білий фон з шумом і кольоровий об'єкт у центрі."""
+    rnd = random.Random(seed)
+    width, height = size
+    img = Image.effect_noise(size, 6).point(lambda v: 255 - abs(v - 128) // 8)
+    img = Image.merge('RGBA', (img, img, img, Image.new('L', size, 255)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0 = rnd.randint(width // 5, width // 2)
+        y0 = rnd.randint(height // 5, height // 2)
+        x1 = rnd.randint(width // 2, width * 4 // 5)
+        y1 = rnd.randint(height // 2, height * 4 // 5)
+        color = tuple(rnd.randint(0, 255) for _ in range(3)) + (255,)
+        draw.ellipse((x0, y0, x1, y1), fill=color)
+    return img
+
+
+def measure(func, img, tolerance):
+    """Повертає (результат, секунди) для одного виклику на копії зображення."""
+    work = img.copy()
+    start = time.perf_counter()
+    result = func(work, tolerance)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark():
+    print(f"Допуск: {TOLERANCE}")
+    print(f"{'Розмір':>12} | {'Старий, Мпікс/с':>16} | {'Новий, Мпікс/с':>15} | {'Прискорення':>11} | Збіг")
+    print("-" * 72)
+    for size in IMAGE_SIZES:
+        img = make_product_photo(size)
+        megapixels = size[0] * size[1] / 1_000_000
+
+        new_result, new_time = measure(remove_white_background, img, TOLERANCE)
+        new_speed = megapixels / new_time
+
+        if size[0] * size[1] <= LEGACY_MAX_PIXELS:
+            old_result, old_time = measure(legacy_remove_white_background, img, TOLERANCE)
+            old_speed = megapixels / old_time
+            identical = "так" if old_result.tobytes() == new_result.tobytes() else "НІ"
+            print(f"{size[0]:>5}x{size[1]:<6} | {old_speed:>16.2f} | {new_speed:>15.2f} | "
+                  f"{old_time / new_time:>10.1f}x | {identical}")
+        else:
+            print(f"{size[0]:>5}x{size[1]:<6} | {'-':>16} | {new_speed:>15.2f} | {'-':>11} | -")
+
+
+if __name__ == "__main__":
+    run_benchmark()
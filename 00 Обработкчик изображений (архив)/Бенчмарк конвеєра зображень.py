@@ -0,0 +1,407 @@
+import argparse
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import PIL
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+from EncoderProfiles import available_profiles, encode_image
+from ImageCore import crop_to_object, fit_to_square, object_bbox, pad_and_flatten, render_product_square, white_mask
+
+# --- Налаштування ---
+# Синтетичні "фото товарів": довша сторона, співвідношення сторін, частка кадру під об'єктом, режим
+STAGE_SIZES = [800, 2000, 4000, 8000]
+QUICK_STAGE_SIZES = [800, 2000]          # Для --quick
+ASPECTS = [1.0, 1.5, 0.5]                # ширина / висота
+OBJECT_FRACTIONS = [0.9, 0.3]            # Велика і мала частка кадру
+MODES = ['RGB', 'RGBA', 'P', 'CMYK']
+REPEATS = 3                              # Повтори кожного етапу; у звіт іде медіана
+
+PIPELINE_SIZES = [2000, 4000]            # Файли для повних скриптів (по кожному режиму і розміру)
+QUICK_PIPELINE_SIZES = [1200]
+
+TOLERANCE = 10
+PADDING_PERCENT = 5
+TARGET_SIZE = 1500
+
+REGRESSION_THRESHOLD = 10.0              # Відсоток уповільнення (або росту пам'яті), що вважається регресією
+MIN_TIME_DELTA = 0.005                   # Різниця в часі менша за це (с) - шум вимірювання, не регресія
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results")
+# --- ---
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PIPELINE_SCRIPTS = {
+    'rename_and_convert_images': ("Переименование, конвертация, на белый фон в квадрат 1500 на 1500 (архив).py", "rename_script"),
+    'make_image_square': ("на квадрат (архив).py", "square_script"),
+    'combine_images': ("MergeImageInOne.py", "merge_script"),
+}
+
+
+def _load_script(filename, module_name):
+    """Імпортує скрипт цієї папки за ім'ям файлу (імена з пробілами і кирилицею)."""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(SCRIPT_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_mb():
+    """Пікова пам'ять поточного процесу (МБ) або None, якщо виміряти нічим."""
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        peak = getattr(info, 'peak_wset', None)  # Windows
+        if peak is not None:
+            return peak / (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux віддає КБ, macOS - байти
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def make_synthetic_photo(long_side, aspect, object_fraction, mode, seed=0):
+    """Біле тло з ледь помітним шумом по краях і кольоровий об'єкт по центру."""
+    rnd = random.Random(seed)
+    if aspect >= 1:
+        width, height = long_side, max(1, int(long_side / aspect))
+    else:
+        width, height = max(1, int(long_side * aspect)), long_side
+    img = Image.new('RGB', (width, height), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    # Майже білі смуги біля країв - вони мають зникати разом з фоном
+    draw.rectangle((0, 0, width - 1, height // 50), fill=(252, 253, 254))
+    object_width, object_height = int(width * object_fraction), int(height * object_fraction)
+    left, top = (width - object_width) // 2, (height - object_height) // 2
+    for _ in range(10):
+        x0 = left + rnd.randint(0, object_width // 2)
+        y0 = top + rnd.randint(0, object_height // 2)
+        x1 = x0 + rnd.randint(object_width // 4, object_width // 2)
+        y1 = y0 + rnd.randint(object_height // 4, object_height // 2)
+        draw.ellipse((x0, y0, x1, y1), fill=tuple(rnd.randint(0, 230) for _ in range(3)))
+    if mode == 'RGBA':
+        img = img.convert('RGBA')
+        # Напівпрозорий край об'єкта, як у вирізаних PNG
+        ImageDraw.Draw(img).rectangle((left, top, left + object_width // 8, top + object_height // 8),
+                                      fill=(40, 80, 160, 128))
+    elif mode == 'P':
+        img = img.convert('P', palette=Image.Palette.ADAPTIVE)
+    elif mode == 'CMYK':
+        img = img.convert('CMYK')
+    return img
+
+
+def _source_format(mode):
+    return 'PNG' if mode in ('RGBA', 'P') else 'JPEG'
+
+
+def _encode_source(img):
+    buffer = io.BytesIO()
+    if _source_format(img.mode) == 'JPEG':
+        img.save(buffer, 'JPEG', quality=92)
+    else:
+        img.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _median_time(func, repeats):
+    """(медіана секунд, результат останнього виклику)."""
+    times = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def run_stage_case(long_side, aspect, object_fraction, mode, repeats=REPEATS):
+    """
+    Міряє окремі етапи шляху "фото -> квадрат 1500" на одному синтетичному фото.
+    Виконується в окремому процесі, щоб пікова пам'ять стосувалася лише цього випадку.
+    """
+    img = make_synthetic_photo(long_side, aspect, object_fraction, mode)
+    source = _encode_source(img)
+    megapixels = img.size[0] * img.size[1] / 1_000_000
+    stages = {}
+
+    def record(name, seconds):
+        stages[name] = {'seconds': seconds, 'mpx_per_s': megapixels / seconds if seconds > 0 else None}
+
+    def decode():
+        with Image.open(io.BytesIO(source)) as decoded:
+            decoded.load()
+            return decoded.copy()
+
+    seconds, img = _median_time(decode, repeats)
+    record('decode', seconds)
+    rgba = img if img.mode in ('RGB', 'RGBA') else img.convert('RGBA')
+    seconds, _ = _median_time(lambda: white_mask(rgba, TOLERANCE), repeats)
+    record('threshold', seconds)
+    seconds, _ = _median_time(lambda: object_bbox(img, TOLERANCE), repeats)
+    record('bbox', seconds)
+    seconds, cropped = _median_time(lambda: crop_to_object(img, TOLERANCE), repeats)
+    record('crop', seconds)
+    if cropped is not None:
+        # Поля і заміна прозорості на білий у ImageCore виконуються одним проходом
+        seconds, flat = _median_time(lambda: pad_and_flatten(cropped, PADDING_PERCENT), repeats)
+        record('pad_flatten', seconds)
+        seconds, square = _median_time(lambda: fit_to_square(flat, TARGET_SIZE).copy(), repeats)
+        record('resize', seconds)
+
+        seconds, _ = _median_time(lambda: encode_image(square), repeats)
+        record('encode', seconds)
+
+    return {
+        'size': list(img.size),
+        'mode': mode,
+        'megapixels': megapixels,
+        'stages': stages,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _make_pipeline_inputs(folder, sizes):
+    """Записує набір синтетичних фото для повних скриптів. Повертає (шляхи, мегапікселі)."""
+    paths = []
+    megapixels = 0.0
+    for size_number, long_side in enumerate(sizes):
+        for mode_number, mode in enumerate(MODES):
+            aspect = ASPECTS[(size_number + mode_number) % len(ASPECTS)]
+            img = make_synthetic_photo(long_side, aspect, OBJECT_FRACTIONS[mode_number % 2], mode,
+                                       seed=size_number * 10 + mode_number)
+            extension = '.png' if _source_format(mode) == 'PNG' else '.jpg'
+            path = os.path.join(folder, f"photo_{long_side}_{mode}{extension}")
+            if mode == 'CMYK':
+                img.save(path, 'JPEG', quality=92)
+            else:
+                img.save(path)
+            paths.append(path)
+            megapixels += img.size[0] * img.size[1] / 1_000_000
+    return paths, megapixels
+
+
+def run_pipeline_case(name, sizes):
+    """Запускає один повний скрипт на наборі файлів у тимчасовій папці (окремий процес)."""
+    with tempfile.TemporaryDirectory() as folder:
+        paths, megapixels = _make_pipeline_inputs(folder, sizes)
+        script = _load_script(*PIPELINE_SCRIPTS[name])
+        # Вивід скриптів не друкуємо: час на консоль не повинен потрапляти в заміри
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            if name == 'rename_and_convert_images':
+                script.rename_and_convert_images(folder, "BENCH", TOLERANCE, PADDING_PERCENT)
+            elif name == 'make_image_square':
+                for path in paths:
+                    script.make_image_square(Path(path))
+            else:
+                script.combine_images(paths, os.path.join(folder, "combined.jpg"))
+            seconds = time.perf_counter() - start
+    return {
+        'files': len(paths),
+        'megapixels': megapixels,
+        'seconds': seconds,
+        'mpx_per_s': megapixels / seconds if seconds > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _in_fresh_process(func, *args):
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(func, *args).result()
+
+
+def run_suite(quick=False, repeats=REPEATS):
+    """Виконує всі випадки і повертає результати (словник для JSON)."""
+    results = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'quick': quick,
+        'stages': {},
+        'pipelines': {},
+    }
+    sizes = QUICK_STAGE_SIZES if quick else STAGE_SIZES
+    for long_side in sizes:
+        for aspect in ASPECTS:
+            for object_fraction in OBJECT_FRACTIONS:
+                for mode in MODES:
+                    key = f"{long_side}px_a{aspect}_o{object_fraction}_{mode}"
+                    case = _in_fresh_process(run_stage_case, long_side, aspect, object_fraction, mode, repeats)
+                    results['stages'][key] = case
+                    times = ", ".join(f"{stage} {data['seconds'] * 1000:.0f}" for stage, data in case['stages'].items())
+                    print(f"{key:<32} | {times} мс | пам'ять {_format_mb(case['peak_rss_mb'])}")
+
+    pipeline_sizes = QUICK_PIPELINE_SIZES if quick else PIPELINE_SIZES
+    for name in PIPELINE_SCRIPTS:
+        case = _in_fresh_process(run_pipeline_case, name, pipeline_sizes)
+        results['pipelines'][name] = case
+        print(f"{name:<32} | {case['files']} файлів, {case['seconds']:.2f} с, "
+              f"{case['mpx_per_s']:.1f} Мпікс/с | пам'ять {_format_mb(case['peak_rss_mb'])}")
+    return results
+
+
+def psnr(img_a, img_b):
+    """PSNR (дБ) між двома RGB зображеннями однакового розміру."""
+    stat = ImageStat.Stat(ImageChops.difference(img_a, img_b))
+    mse = sum(stat.sum2) / (img_a.size[0] * img_a.size[1] * len(stat.sum2))
+    if mse == 0:
+        return float('inf')
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def run_profiles(source_directory=None, repeats=REPEATS):
+    """
+    Кодує квадрати TARGET_SIZE кожним доступним профілем EncoderProfiles.
+    Повертає {профіль: {'encode_ms', 'bytes', 'psnr'}} - медіани по всіх зображеннях;
+    PSNR рахується відносно квадрата до кодування.
+    """
+    if source_directory:
+        images = []
+        for name in sorted(os.listdir(source_directory)):
+            try:
+                with Image.open(os.path.join(source_directory, name)) as img:
+                    images.append(img.copy())
+            except OSError:
+                continue
+    else:
+        images = [make_synthetic_photo(long_side, ASPECTS[n % len(ASPECTS)], OBJECT_FRACTIONS[n % 2], mode, seed=n)
+                  for n, (long_side, mode) in enumerate((s, m) for s in (2000, 4000) for m in MODES)]
+    squares = []
+    for img in images:
+        square = render_product_square(img, TOLERANCE, PADDING_PERCENT, TARGET_SIZE)
+        if square is not None:
+            squares.append(square.copy())  # Холст fit_to_square перевикористовується
+
+    results = {}
+    print(f"{'Профіль':<10} | {'Кодування, мс':>13} | {'Розмір, КБ':>10} | {'PSNR, дБ':>8}")
+    print("-" * 52)
+    for profile in available_profiles():
+        times, sizes, similarity = [], [], []
+        for square in squares:
+            seconds, data = _median_time(lambda: encode_image(square, profile), repeats)
+            with Image.open(io.BytesIO(data)) as decoded:
+                similarity.append(psnr(square, decoded.convert('RGB')))
+            times.append(seconds)
+            sizes.append(len(data))
+        results[profile] = {
+            'encode_ms': statistics.median(times) * 1000,
+            'bytes': statistics.median(sizes),
+            'psnr': statistics.median(similarity),
+        }
+        print(f"{profile:<10} | {results[profile]['encode_ms']:>13.1f} | {results[profile]['bytes'] / 1024:>10.0f} | "
+              f"{results[profile]['psnr']:>8.1f}")
+    return results
+
+
+def _format_mb(value):
+    return f"{value:.0f} МБ" if value is not None else "-"
+
+
+def _change_percent(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare_results(old, new, threshold=REGRESSION_THRESHOLD):
+    """Друкує порівняння двох запусків. Повертає кількість регресій (час або пам'ять гірші за threshold %)."""
+    rows = []
+    for key, new_case in new.get('stages', {}).items():
+        old_case = old.get('stages', {}).get(key)
+        if old_case is None:
+            continue
+        for stage, data in new_case['stages'].items():
+            old_data = old_case['stages'].get(stage)
+            if old_data is not None:
+                rows.append((f"{key} {stage}", 'с', old_data['seconds'], data['seconds']))
+        rows.append((f"{key} пам'ять", 'МБ', old_case.get('peak_rss_mb'), new_case.get('peak_rss_mb')))
+    for name, data in new.get('pipelines', {}).items():
+        old_data = old.get('pipelines', {}).get(name)
+        if old_data is not None:
+            rows.append((name, 'с', old_data['seconds'], data['seconds']))
+            rows.append((f"{name} пам'ять", 'МБ', old_data.get('peak_rss_mb'), data.get('peak_rss_mb')))
+
+    regressions = 0
+    print(f"{'Випадок':<48} | {'Було':>10} | {'Стало':>10} | {'Зміна':>8} |")
+    print("-" * 90)
+    for name, unit, old_value, new_value in rows:
+        change = _change_percent(old_value, new_value)
+        if change is None:
+            continue
+        verdict = ""
+        noise = unit == 'с' and abs(new_value - old_value) < MIN_TIME_DELTA
+        if change > threshold and not noise:
+            verdict = "РЕГРЕСІЯ"
+            regressions += 1
+        elif change < -threshold and not noise:
+            verdict = "краще"
+        print(f"{name:<48} | {old_value:>8.3f} {unit:<2}| {new_value:>8.3f} {unit:<2}| {change:>+7.1f}% | {verdict}")
+    print(f"\nРегресій (гірше ніж на {threshold}%): {regressions}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк скриптів обробки зображень")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Виконати бенчмарк і зберегти результати в JSON")
+    run_parser.add_argument('-o', '--output', help="Файл результатів (за замовчуванням - benchmark_results/<дата>.json)")
+    run_parser.add_argument('--quick', action='store_true', help="Лише малі розміри (швидка перевірка)")
+    run_parser.add_argument('--repeats', type=int, default=REPEATS, help="Повторів кожного етапу")
+
+    profiles_parser = subparsers.add_parser('profiles', help="Порівняти профілі кодування (час, розмір, PSNR)")
+    profiles_parser.add_argument('--source', help="Папка з реальними зображеннями (за замовчуванням - синтетичні)")
+    profiles_parser.add_argument('-o', '--output', help="Зберегти результати в JSON")
+    profiles_parser.add_argument('--repeats', type=int, default=REPEATS, help="Повторів кодування")
+
+    compare_parser = subparsers.add_parser('compare', help="Порівняти два файли результатів")
+    compare_parser.add_argument('old', help="Попередній запуск (JSON)")
+    compare_parser.add_argument('new', help="Новий запуск (JSON)")
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                                help="Відсоток погіршення, що вважається регресією")
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        results = run_suite(quick=args.quick, repeats=args.repeats)
+        output_path = args.output
+        if not output_path:
+            os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+            output_path = os.path.join(DEFAULT_RESULTS_DIR, datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультати збережено: {output_path}")
+    elif args.command == 'profiles':
+        results = run_profiles(args.source, args.repeats)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+    else:
+        with open(args.old, 'r', encoding='utf-8') as f:
+            old = json.load(f)
+        with open(args.new, 'r', encoding='utf-8') as f:
+            new = json.load(f)
+        if compare_results(old, new, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
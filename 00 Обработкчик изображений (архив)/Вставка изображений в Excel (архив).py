@@ -1,11 +1,21 @@
+import io
 import openpyxl
 from openpyxl.drawing.image import Image as OpenpyxlImage
+from openpyxl.utils import column_index_from_string
 from PIL import Image as PILImage
 import os
-import re
 import sys
+import tempfile
+import time
+from collections import Counter
 from pathlib import Path
 
+from ArticleFileIndex import ArticleFileIndex
+from BatchRunner import run_tasks
+from ImageCore import remove_white_background
+from XlsxMedia import deduplicate_media
+from XlsxStreaming import SheetCopier, column_width, iter_sheet_rows, open_streaming_workbook
+
 
 # Функция для проверки существования пути
 def check_path(path, is_folder=False):
@@ -21,178 +31,409 @@ def check_path(path, is_folder=False):
         sys.exit(1)
 
 
-# Путь к папке с изображениями
-folder_path = "C:/Users/ABM/Desktop/Image_1c/"
-# Путь к существующему файлу Excel
-file_path = r"C:\Users\ABM\Desktop\Робота\25 Антошка статус\Статус актуальності Антошка.xlsx"
-# Проверяем существование путей
-check_path(folder_path, is_folder=True)
-check_path(file_path, is_folder=False)
-# Выбор исходной ячейки (столбец с именами изображений)
-input_column = 'C'  # Входной столбец с именами изображений
-# Выбор целевой ячейки (столбец, куда будут вставляться изображения)
-output_column = 'A'  # Столбец, в который вставляются изображения
+# Функция подготовки изображения для ячейки: удаление фона и уменьшение до размера ячейки.
+# Результат - байты PNG (в папку с изображениями ничего не пишется), размер картинки на листе и размер PNG.
+# Выполняется и в процессах пула, поэтому определена на верхнем уровне модуля.
+def prepare_image(image_path, cell_width_px, cell_height_px, threshold=240, dpi_factor=2):
+    try:
+        with PILImage.open(image_path) as source:
+            # Сохраняем пропорции: подгоняем изображение, чтобы оно вписалось в ячейку
+            scale_factor = min(cell_width_px / source.width, cell_height_px / source.height)
+            display_size = (int(source.width * scale_factor), int(source.height * scale_factor))
+            if display_size[0] < 1 or display_size[1] < 1:
+                print(f"ОШИБКА: ячейка слишком мала для изображения {image_path}")
+                return None
+            # Реальное разрешение - размер в ячейке с запасом dpi_factor, но не больше исходного
+            render_size = (min(source.width, round(display_size[0] * dpi_factor)),
+                           min(source.height, round(display_size[1] * dpi_factor)))
+            # JPEG сразу декодируется в уменьшенном масштабе (не меньше render_size)
+            source.draft('RGB', render_size)
+            img = source.convert("RGBA")
 
+        # Пиксели, у которых все RGB значения выше порога, делаем прозрачными белыми.
+        # "> threshold" для целых значений то же самое, что ">= 255 - (254 - threshold)"
+        img = remove_white_background(img, 254 - threshold, clear_color=True)
+        if img.size != render_size:
+            img = img.resize(render_size, PILImage.Resampling.LANCZOS)
 
-# Функция для нормализации имен (удаление пробелов и символов, приведение к нижнему регистру)
-def normalize_name(name):
-    if name is None:
-        return ""
-    # Удаляем все символы, кроме букв и цифр, и приводим к нижнему регистру
-    return re.sub(r'[^a-zA-Z0-9а-яА-Я]', '', str(name)).lower()
+        buffer = io.BytesIO()
+        img.save(buffer, "PNG")
+        return buffer.getvalue(), display_size, render_size
+    except Exception as e:
+        print(f"ОШИБКА при удалении фона изображения {image_path}: {e}")
+        return None
 
 
-# Функция для удаления фона изображения
-def remove_background(image_path, output_path, threshold=240):
+# Функция открытия индекса файлов папок по нормализованным именам: перечитываются только измененные папки
+def open_image_index(image_folders, search_subfolders=False):
+    folders_text = ", ".join(image_folders)
+    index = ArticleFileIndex(image_folders, recursive=search_subfolders)
     try:
-        # Открываем изображение
-        img = PILImage.open(image_path).convert("RGBA")
-        datas = img.getdata()
-
-        # Создаем новый список пикселей с прозрачным фоном
-        new_data = []
-        for item in datas:
-            # Если пиксель близок к белому, делаем его прозрачным
-            if all(value > threshold for value in item[:3]):  # RGB значения выше порога
-                new_data.append((255, 255, 255, 0))  # Прозрачный пиксель
-            else:
-                new_data.append(item)
-
-        # Применяем новые данные к изображению
-        img.putdata(new_data)
-        img.save(output_path, "PNG")  # Сохраняем во временный файл в формате PNG
-        return output_path
+        rescanned, total_folders = index.refresh()
+        print(f"Индекс изображений: папок {total_folders}, перечитано {rescanned}, файлов {index.file_count()}")
     except Exception as e:
-        print(f"ОШИБКА при удалении фона изображения {image_path}: {e}")
-        return None
+        print(f"ОШИБКА при чтении содержимого папок: {e}")
+        index.close()
+        sys.exit(1)
 
+    # Проверяем, найдены ли изображения
+    if not index.file_count():
+        print(f"ПРЕДУПРЕЖДЕНИЕ: В папках {folders_text} не найдено изображений в формате JPG, JPEG или PNG.")
+        choice = input("Хотите продолжить? (y/n): ")
+        if choice.lower() != 'y':
+            print("Операция отменена пользователем.")
+            index.close()
+            sys.exit(0)
+
+    # Несколько файлов с одинаковым нормализованным именем: берется первый по порядку папок, глубины и расширений
+    collisions = index.collisions()
+    if collisions:
+        print(f"ПРЕДУПРЕЖДЕНИЕ: имен с несколькими файлами: {len(collisions)}")
+        for paths in list(collisions.values())[:10]:
+            print(f"  {paths[0]} и еще {len(paths) - 1}: {', '.join(os.path.basename(path) for path in paths[1:])}")
+    return index
 
-# Попытка открыть файл
-try:
-    wb = openpyxl.load_workbook(file_path)
-    ws = wb.active  # Получаем активный лист
-except FileNotFoundError:
-    print(f"Файл {file_path} не найден. Проверьте правильность пути.")
-    sys.exit(1)
-except PermissionError:
-    print(f"ОШИБКА: Невозможно открыть файл {file_path}.")
-    print("Файл может быть открыт в другой программе. Закройте Excel и попробуйте снова.")
-    sys.exit(1)
-except Exception as e:
-    print(f"ОШИБКА при открытии файла: {e}")
-    sys.exit(1)
-
-# Начинаем с первой строки
-start_row = 2  # Начальная строка для обработки
-# Получаем список всех файлов в папке и нормализуем их имена
-file_dict = {}
-try:
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith(('.jpg', '.jpeg', '.png')):  # Проверяем расширение файлов
-            name_without_ext = os.path.splitext(filename)[0]
-            normalized_name = normalize_name(name_without_ext)
-            file_dict[normalized_name] = filename
-except PermissionError:
-    print(f"ОШИБКА: Отказано в доступе к папке {folder_path}.")
-    print("Проверьте права доступа и попробуйте снова.")
-    sys.exit(1)
-except Exception as e:
-    print(f"ОШИБКА при чтении содержимого папки: {e}")
-    sys.exit(1)
-
-# Проверяем, найдены ли изображения
-if not file_dict:
-    print(f"ПРЕДУПРЕЖДЕНИЕ: В папке {folder_path} не найдено изображений в формате JPG, JPEG или PNG.")
-    choice = input("Хотите продолжить? (y/n): ")
-    if choice.lower() != 'y':
-        print("Операция отменена пользователем.")
-        sys.exit(0)
-
-# Обрабатываем все ячейки в исходной колонке начиная с указанной строки
-try:
-    for row in range(start_row, ws.max_row + 1):
-        cell_value = ws[f'{input_column}{row}'].value  # Получаем значение из исходной ячейки
-        if cell_value:  # Если значение не пустое
-            # Нормализуем имя из ячейки
-            normalized_cell_value = normalize_name(cell_value)
-            # Ищем соответствующий файл в словаре нормализованных имен
-            if normalized_cell_value in file_dict:
-                actual_filename = file_dict[normalized_cell_value]
-                image_path = os.path.join(folder_path, actual_filename)
-                print(f"Изображение найдено: {image_path}")
-                try:
-                    # Создаем временный файл
-                    temp_image_path = os.path.join(folder_path, f"temp_{actual_filename}")
-
-                    # Удаляем фон изображения во временном файле
-                    processed_image_path = remove_background(image_path, temp_image_path)
-
-                    if processed_image_path:
-                        # Загружаем обработанное изображение
-                        pil_img = PILImage.open(processed_image_path)
-                        img_width, img_height = pil_img.size
-
-                        # Создаем объект Image для добавления в Excel
-                        img = OpenpyxlImage(processed_image_path)
-
-                        # Получаем размеры целевой ячейки
-                        cell_width = ws.column_dimensions[output_column].width  # Получаем ширину целевого столбца
-                        if cell_width is None:
-                            cell_width = 10  # Устанавливаем значение по умолчанию
-                        cell_height = ws.row_dimensions[row].height  # Получаем высоту строки
-                        if cell_height is None:
-                            cell_height = 15  # Устанавливаем значение по умолчанию
-
-                        # Размеры ячейки в пикселях (коэффициенты для преобразования)
-                        cell_width_px = cell_width * 7  # Преобразуем ширину в пиксели
-                        cell_height_px = cell_height * 1.35  # Преобразуем высоту в пиксели
-
-                        # Сохраняем пропорции: подгоняем изображение, чтобы оно вписалось в ячейку
-                        scale_factor = min(cell_width_px / img_width, cell_height_px / img_height)
-                        img.width = int(img_width * scale_factor)
-                        img.height = int(img_height * scale_factor)
-
-                        # Привязываем изображение к ячейке
-                        img.anchor = f'{output_column}{row}'  # Размещение изображения в целевой ячейке
-
-                        # Центрируем изображение в ячейке
-                        img.left = (cell_width_px - img.width) / 2  # Центрируем по горизонтали
-                        img.top = (cell_height_px - img.height) / 2  # Центрируем по вертикали
-
-                        # Вставляем изображение в ячейку
-                        ws.add_image(img, f'{output_column}{row}')
-
-                        # Удаляем временный файл после использования
-                        os.remove(temp_image_path)
-                except PermissionError:
-                    pass
-                except Exception as e:
-                    print(f"ОШИБКА при обработке изображения {image_path}: {e}")
-            else:
-                print(f"Изображение для '{cell_value}' не найдено в папке: {folder_path}")
-        else:
-            print(f"В ячейке {input_column}{row} нет имени изображения.")
 
-    # Определяем новый путь для сохранения файла с добавленным суффиксом
+# Функция пути для сохранения: исходное имя с суффиксом " with images"
+def output_file_path(file_path):
     file_dir, file_name = os.path.split(file_path)  # Получаем директорию и имя файла
     new_file_name = os.path.splitext(file_name)[0] + " with images" + os.path.splitext(file_name)[
         1]  # Добавляем суффикс
-    new_file_path = os.path.join(file_dir, new_file_name)  # Новый путь к файлу
+    return os.path.join(file_dir, new_file_name)  # Новый путь к файлу
+
+
+# Функция вставки изображений в книгу.
+# Сначала каждая строка сопоставляется с файлом, затем уникальные изображения готовятся
+# (при workers > 1 - в пуле процессов), и в конце вставляются в книгу по порядку строк.
+def insert_images(file_path, image_folders, input_column, output_column, start_row=2, dpi_factor=2,
+                  background_threshold=240, workers=1, search_subfolders=False):
+    started = time.perf_counter()
+
+    # Попытка открыть файл
+    try:
+        wb = openpyxl.load_workbook(file_path)
+        ws = wb.active  # Получаем активный лист
+    except FileNotFoundError:
+        print(f"Файл {file_path} не найден. Проверьте правильность пути.")
+        sys.exit(1)
+    except PermissionError:
+        print(f"ОШИБКА: Невозможно открыть файл {file_path}.")
+        print("Файл может быть открыт в другой программе. Закройте Excel и попробуйте снова.")
+        sys.exit(1)
+    except Exception as e:
+        print(f"ОШИБКА при открытии файла: {e}")
+        sys.exit(1)
+
+    folders_text = ", ".join(image_folders)
+    index = open_image_index(image_folders, search_subfolders)
+
+    try:
+        # 1. Сопоставляем строки с файлами: (строка, ключ изображения, размер ячейки в пикселях)
+        placements = []
+        for row in range(start_row, ws.max_row + 1):
+            cell_value = ws[f'{input_column}{row}'].value  # Получаем значение из исходной ячейки
+            if cell_value:  # Если значение не пустое
+                # Ищем файл по нормализованному имени (или вариант article_1, если самого артикула нет)
+                image_path = index.resolve(cell_value)
+                if image_path:
+                    print(f"Изображение найдено: {image_path}")
+
+                    # Получаем размеры целевой ячейки
+                    cell_width = ws.column_dimensions[output_column].width  # Получаем ширину целевого столбца
+                    if cell_width is None:
+                        cell_width = 10  # Устанавливаем значение по умолчанию
+                    cell_height = ws.row_dimensions[row].height  # Получаем высоту строки
+                    if cell_height is None:
+                        cell_height = 15  # Устанавливаем значение по умолчанию
+
+                    # Размеры ячейки в пикселях (коэффициенты для преобразования)
+                    cell_width_px = cell_width * 7  # Преобразуем ширину в пиксели
+                    cell_height_px = cell_height * 1.35  # Преобразуем высоту в пиксели
+
+                    image_key = (image_path, background_threshold, cell_width_px, cell_height_px)
+                    placements.append((row, image_key, cell_width_px, cell_height_px))
+                else:
+                    print(f"Изображение для '{cell_value}' не найдено в папках: {folders_text}")
+            else:
+                print(f"В ячейке {input_column}{row} нет имени изображения.")
+        resolved = time.perf_counter()
+
+        # 2. Готовим изображения: (файл, порог, размер ячейки) -> (байты PNG, размер на листе).
+        # Артикул, повторяющийся в нескольких строках, обрабатывается один раз.
+        unique_keys = list(dict.fromkeys(image_key for _, image_key, _, _ in placements))
+        tasks = [(image_path, cell_width_px, cell_height_px, threshold, dpi_factor)
+                 for image_path, threshold, cell_width_px, cell_height_px in unique_keys]
+        print(f"\nСтрок с изображениями: {len(placements)}, уникальных изображений: {len(tasks)}, "
+              f"процессов: {workers}")
+        prepared_images = {}
+        report_every = max(1, len(tasks) // 20)
+        for image_key, (_, prepared) in zip(unique_keys, run_tasks(prepare_image, tasks, workers)):
+            prepared_images[image_key] = prepared
+            done = len(prepared_images)
+            if done % report_every == 0 or done == len(tasks):
+                elapsed = time.perf_counter() - resolved
+                print(f"  Подготовлено {done}/{len(tasks)} ({done / elapsed if elapsed else 0:.1f} изобр./с)")
+        prepared_at = time.perf_counter()
 
-    # Сохраняем файл Excel с новым именем
+        # 3. Вставляем изображения в порядке строк
+        inserted = 0
+        for row, image_key, cell_width_px, cell_height_px in placements:
+            prepared = prepared_images[image_key]
+            if not prepared:
+                continue
+            try:
+                image_data, (display_width, display_height), _ = prepared
+
+                # Создаем объект Image для добавления в Excel (openpyxl закрывает буфер при сохранении)
+                img = OpenpyxlImage(io.BytesIO(image_data))
+                img.width = display_width
+                img.height = display_height
+
+                # Привязываем изображение к ячейке
+                img.anchor = f'{output_column}{row}'  # Размещение изображения в целевой ячейке
+
+                # Центрируем изображение в ячейке
+                img.left = (cell_width_px - img.width) / 2  # Центрируем по горизонтали
+                img.top = (cell_height_px - img.height) / 2  # Центрируем по вертикали
+
+                # Вставляем изображение в ячейку
+                ws.add_image(img, f'{output_column}{row}')
+                inserted += 1
+            except Exception as e:
+                print(f"ОШИБКА при обработке изображения {image_key[0]}: {e}")
+        inserted_at = time.perf_counter()
+
+        # Определяем новый путь для сохранения файла с добавленным суффиксом
+        new_file_path = output_file_path(file_path)
+
+        # Сохраняем файл Excel с новым именем
+        try:
+            wb.save(new_file_path)
+            print(f"Файл успешно сохранен: {new_file_path}")
+        except PermissionError:
+            print(f"ОШИБКА: Невозможно сохранить файл {new_file_path}.")
+            print("Файл может быть открыт в другой программе. Закройте Excel и попробуйте снова.")
+            sys.exit(1)
+        except Exception as e:
+            print(f"ОШИБКА при сохранении файла: {e}")
+            sys.exit(1)
+
+        # Одинаковые картинки (повторы артикула) остаются в файле одной копией.
+        # Книга уже сохранена: если объединить не удалось, она остается как есть
+        try:
+            removed, saved_bytes = deduplicate_media(new_file_path)
+            if removed:
+                print(f"Повторяющихся изображений объединено: {removed} (-{saved_bytes / (1024 * 1024):.1f} МБ)")
+        except Exception as e:
+            print(f"ПРЕДУПРЕЖДЕНИЕ: не удалось объединить повторяющиеся изображения ({e}), "
+                  f"файл сохранен без объединения")
+
+    except Exception as e:
+        print(f"ОШИБКА при выполнении программы: {e}")
+        sys.exit(1)
+    finally:
+        index.close()
+
+    finished = time.perf_counter()
+    total = finished - started
+    print(f"\nВставлено изображений: {inserted} из {len(placements)} строк за {total:.1f} с "
+          f"({inserted / total if total else 0:.1f} строк/с)")
+    print(f"  Чтение книги и поиск файлов: {resolved - started:.1f} с")
+    print(f"  Подготовка изображений: {prepared_at - resolved:.1f} с")
+    print(f"  Вставка в лист: {inserted_at - prepared_at:.1f} с")
+    print(f"  Сохранение: {finished - inserted_at:.1f} с")
+
+
+# Функция вставки изображений с потоковой записью (для листов в десятки тысяч строк).
+# Исходная книга читается в режиме read_only, новая пишется через xlsxwriter в режиме constant_memory:
+# строки записываются по мере готовности изображений, а готовые PNG лежат во временной папке до
+# закрытия книги, так что память не растет ни с числом строк, ни с числом уникальных изображений.
+# Переносятся значения, числовые форматы, ширина колонок и высота строк всех листов (без прочего оформления).
+def insert_images_streaming(file_path, image_folders, input_column, output_column, start_row=2, dpi_factor=2,
+                            background_threshold=240, workers=1, search_subfolders=False):
+    started = time.perf_counter()
+
+    # Попытка открыть файл
     try:
-        wb.save(new_file_path)
-        print(f"Файл успешно сохранен: {new_file_path}")
+        wb = openpyxl.load_workbook(file_path, read_only=True)
+        ws = wb.active  # Получаем активный лист
+    except FileNotFoundError:
+        print(f"Файл {file_path} не найден. Проверьте правильность пути.")
+        sys.exit(1)
     except PermissionError:
-        print(f"ОШИБКА: Невозможно сохранить файл {new_file_path}.")
+        print(f"ОШИБКА: Невозможно открыть файл {file_path}.")
         print("Файл может быть открыт в другой программе. Закройте Excel и попробуйте снова.")
         sys.exit(1)
     except Exception as e:
-        print(f"ОШИБКА при сохранении файла: {e}")
+        print(f"ОШИБКА при открытии файла: {e}")
         sys.exit(1)
 
-except Exception as e:
-    print(f"ОШИБКА при выполнении программы: {e}")
-    sys.exit(1)
+    # Потоковая запись опирается на внутренние части openpyxl и xlsxwriter: если с установленными
+    # версиями она невозможна, книга обрабатывается обычным способом
+    new_file_path = output_file_path(file_path)
+    try:
+        target_wb = open_streaming_workbook(new_file_path, wb)
+    except (ImportError, RuntimeError) as e:
+        print(f"ПРЕДУПРЕЖДЕНИЕ: {e}")
+        print("Книга будет обработана через openpyxl.")
+        wb.close()
+        insert_images(file_path, image_folders, input_column, output_column, start_row, dpi_factor,
+                      background_threshold, workers, search_subfolders)
+        return
+
+    folders_text = ", ".join(image_folders)
+    index = open_image_index(image_folders, search_subfolders)
+    temp_dir = None
+
+    try:
+        # 1. Первый проход по листу: сопоставляем строки с файлами
+        input_column_index = column_index_from_string(input_column)
+        placements = {}  # строка -> ключ изображения
+        for row, row_attrs, cells, columns in iter_sheet_rows(ws):
+            if row < start_row:
+                continue
+            # Получаем значение из исходной ячейки
+            cell_value = next((cell['value'] for cell in cells if cell['column'] == input_column_index), None)
+            if cell_value:  # Если значение не пустое
+                # Ищем файл по нормализованному имени (или вариант article_1, если самого артикула нет)
+                image_path = index.resolve(cell_value)
+                if image_path:
+                    print(f"Изображение найдено: {image_path}")
+                    # Размеры ячейки в пикселях (коэффициенты для преобразования)
+                    cell_width_px = column_width(columns, output_column) * 7  # Преобразуем ширину в пиксели
+                    cell_height_px = float(row_attrs.get('ht', 15)) * 1.35  # Преобразуем высоту в пиксели
+                    placements[row] = (image_path, background_threshold, cell_width_px, cell_height_px)
+                else:
+                    print(f"Изображение для '{cell_value}' не найдено в папках: {folders_text}")
+            else:
+                print(f"В ячейке {input_column}{row} нет имени изображения.")
+        resolved = time.perf_counter()
+
+        # 2. Изображения готовятся в фоне (или по одному при workers = 1) в порядке первого появления,
+        # а второй проход по листу пишет строки и забирает готовые изображения по мере надобности.
+        # Пул уходит вперед не больше чем на несколько изображений на процесс от записываемой строки
+        unique_keys = list(dict.fromkeys(placements.values()))
+        tasks = [(image_path, cell_width_px, cell_height_px, threshold, dpi_factor)
+                 for image_path, threshold, cell_width_px, cell_height_px in unique_keys]
+        print(f"\nСтрок с изображениями: {len(placements)}, уникальных изображений: {len(tasks)}, "
+              f"процессов: {workers}")
+        results = zip(unique_keys, run_tasks(prepare_image, tasks, workers, window=workers * 4))
+        remaining = Counter(placements.values())  # ключ -> сколько строк еще ждут это изображение
+        prepared_images = {}  # ключ -> (временный PNG, масштаб по X, по Y) или None, пока его ждут строки
+        prepared_count = 0
+        report_every = max(1, len(tasks) // 20)
+        inserted = 0
+        output_column_index = column_index_from_string(output_column) - 1
+
+        # xlsxwriter читает картинки из файлов при закрытии книги - байты не копятся в памяти до конца
+        temp_dir = tempfile.TemporaryDirectory()
+        for source_ws in wb.worksheets:
+            copier = SheetCopier(source_ws, target_wb)
+            if source_ws.title == ws.title:
+                copier.target.activate()
+            sheet_columns = {}
+            for row, row_attrs, cells, columns in iter_sheet_rows(source_ws, sheet_columns):
+                copier.write_row(row, row_attrs, cells, columns)
+                image_key = placements.get(row) if source_ws.title == ws.title else None
+                if image_key is None:
+                    continue
+                while image_key not in prepared_images:
+                    ready_key, (_, prepared) = next(results)
+                    if prepared:
+                        image_data, (display_width, display_height), (render_width, render_height) = prepared
+                        png_path = os.path.join(temp_dir.name, f"{prepared_count}.png")
+                        with open(png_path, 'wb') as f:
+                            f.write(image_data)
+                        # Реальный размер PNG больше размера на листе в dpi_factor раз - задаем масштаб
+                        prepared = (png_path, display_width / render_width, display_height / render_height)
+                    prepared_images[ready_key] = prepared
+                    prepared_count += 1
+                    if prepared_count % report_every == 0 or prepared_count == len(tasks):
+                        elapsed = time.perf_counter() - resolved
+                        print(f"  Подготовлено {prepared_count}/{len(tasks)} "
+                              f"({prepared_count / elapsed if elapsed else 0:.1f} изобр./с)")
+                prepared = prepared_images[image_key]
+                remaining[image_key] -= 1
+                if not remaining[image_key]:
+                    del prepared_images[image_key]  # Последняя строка с этим изображением
+                if not prepared:
+                    continue
+                png_path, x_scale, y_scale = prepared
+                # Одинаковые картинки xlsxwriter сам сохраняет в файле одной копией
+                copier.target.insert_image(row - 1, output_column_index, png_path,
+                                           {'x_scale': x_scale, 'y_scale': y_scale,
+                                            'description': os.path.basename(image_key[0])})
+                inserted += 1
+            # Лист без строк: ширина колонок задается после чтения листа
+            copier.finish(sheet_columns)
+        inserted_at = time.perf_counter()
+
+        # Сохраняем файл Excel с новым именем
+        try:
+            target_wb.close()
+            print(f"Файл успешно сохранен: {new_file_path}")
+        except PermissionError:
+            print(f"ОШИБКА: Невозможно сохранить файл {new_file_path}.")
+            print("Файл может быть открыт в другой программе. Закройте Excel и попробуйте снова.")
+            sys.exit(1)
+        except Exception as e:
+            print(f"ОШИБКА при сохранении файла: {e}")
+            sys.exit(1)
+
+    except Exception as e:
+        print(f"ОШИБКА при выполнении программы: {e}")
+        sys.exit(1)
+    finally:
+        index.close()
+        wb.close()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    finished = time.perf_counter()
+    total = finished - started
+    print(f"\nВставлено изображений: {inserted} из {len(placements)} строк за {total:.1f} с "
+          f"({inserted / total if total else 0:.1f} строк/с)")
+    print(f"  Чтение листа и поиск файлов: {resolved - started:.1f} с")
+    print(f"  Подготовка изображений и запись строк: {inserted_at - resolved:.1f} с")
+    print(f"  Сохранение: {finished - inserted_at:.1f} с")
+
+
+if __name__ == "__main__":
+    # Папки с изображениями; при одинаковых именах приоритет у папки выше в списке
+    image_folders = ["C:/Users/ABM/Desktop/Image_1c/"]
+    # Путь к существующему файлу Excel
+    file_path = r"C:\Users\ABM\Desktop\Робота\25 Антошка статус\Статус актуальності Антошка.xlsx"
+    # Проверяем существование путей
+    for folder_path in image_folders:
+        check_path(folder_path, is_folder=True)
+    check_path(file_path, is_folder=False)
+    # Искать изображения и в подпапках (при одинаковых именах приоритет у файла ближе к папке из списка);
+    # False - только файлы самих папок из списка, как раньше
+    search_subfolders = False
+    # Выбор исходной ячейки (столбец с именами изображений)
+    input_column = 'C'  # Входной столбец с именами изображений
+    # Выбор целевой ячейки (столбец, куда будут вставляться изображения)
+    output_column = 'A'  # Столбец, в который вставляются изображения
+    # Начинаем с первой строки
+    start_row = 2  # Начальная строка для обработки
+    # Во сколько раз разрешение вставляемой картинки больше размера ячейки в пикселях
+    # (1 - ровно по ячейке, 2 - четко при увеличении и на экранах с высокой плотностью)
+    dpi_factor = 2
+    # Порог белого: пиксели светлее него становятся прозрачными
+    background_threshold = 240
+    # Сколько процессов готовят изображения (1 - последовательно в этом процессе)
+    workers = os.cpu_count() or 1
+    # Способ записи: "openpyxl" - вся книга в памяти, сохраняется все оформление;
+    # "xlsxwriter" - потоковая запись для очень больших листов (нужен пакет xlsxwriter), переносятся
+    # значения, числовые форматы, ширина колонок и высота строк. Проверено с openpyxl 3.1.5 и xlsxwriter 3.2.9;
+    # если пакета нет или версии несовместимы, используется "openpyxl"
+    output_backend = "openpyxl"
+
+    if output_backend == "xlsxwriter":
+        insert_images_streaming(file_path, image_folders, input_column, output_column, start_row, dpi_factor,
+                                background_threshold, workers, search_subfolders)
+    else:
+        insert_images(file_path, image_folders, input_column, output_column, start_row, dpi_factor,
+                      background_threshold, workers, search_subfolders)
 
-print("Работа программы завершена.")
+    print("Работа программы завершена.")
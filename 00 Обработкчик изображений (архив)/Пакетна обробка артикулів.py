@@ -0,0 +1,263 @@
+import csv
+import json
+import os
+import time
+
+from BatchRunner import run_tasks
+from EncoderProfiles import DEFAULT_PROFILE, get_profile
+from ImageCore import DERIVATIVE_SUFFIX, TILE_MEGAPIXELS
+from ImageSizeIndex import ImageSizeIndex
+from RenamePlanner import recover_renames
+from SquarePipeline import convert_file, list_source_files, rename_to_article
+from StageMetrics import FILE_STATUSES, StageMetrics, current_metrics, set_metrics
+
+
+def convert_article_file(folder_path, file, *options):
+    """
+    Обробляє один файл як скрипт 1500 (виконується у воркері або послідовно).
+    Повертає статус файлу з StageMetrics.FILE_STATUSES.
+    """
+    metrics = current_metrics()
+    before = dict(metrics.counters)
+    convert_file(folder_path, file, *options)
+    for status in FILE_STATUSES:
+        if metrics.counters.get(status, 0) > before.get(status, 0):
+            return status
+    return 'failed'
+
+
+def read_batch_manifest(manifest_path, has_header=True):
+    """
+    Пари (папка, артикул) з CSV (роздільник , ; або табуляція) або Excel (.xlsx, перший аркуш):
+    перша колонка - папка, друга - артикул. Рядки без папки чи артикулу пропускаються.
+    """
+    if manifest_path.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+        workbook = load_workbook(manifest_path, read_only=True, data_only=True)
+        rows = [row[:2] for row in workbook.worksheets[0].iter_rows(values_only=True)]
+        workbook.close()
+    else:
+        with open(manifest_path, 'r', encoding='utf-8-sig', newline='') as f:
+            sample = f.read(4096)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+            except csv.Error:
+                dialect = csv.excel
+            rows = [row[:2] for row in csv.reader(f, dialect)]
+    if has_header:
+        rows = rows[1:]
+    entries = []
+    for row in rows:
+        if len(row) < 2 or row[0] is None or row[1] is None:
+            continue
+        folder, article = str(row[0]).strip(), str(row[1]).strip()
+        if folder and article:
+            entries.append((folder, article))
+    return entries
+
+
+def _merge_duplicate_folders(entries):
+    """
+    Один рядок на папку: однакова папка двічі поставила б ті самі файли в пул двічі,
+    і два воркери писали б один результат. Діє артикул з останнього рядка.
+    """
+    merged = {}
+    for folder_path, article in entries:
+        key = os.path.normcase(os.path.abspath(folder_path))
+        previous = merged.get(key)
+        if previous is not None:
+            note = f"артикул {previous[1]} замінено на {article}" if previous[1] != article else "повтор пропущено"
+            print(f"  ! Папка вказана в маніфесті кілька разів: {folder_path} ({note})")
+            folder_path = previous[0]
+        merged[key] = (folder_path, article)
+    return list(merged.values())
+
+
+def _load_progress(progress_path):
+    """{папка: запис} для папок, оброблених попередніми запусками (журнал JSON Lines)."""
+    done = {}
+    try:
+        with open(progress_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    done[entry['folder']] = entry
+                except (ValueError, KeyError, TypeError):
+                    continue  # Недописаний рядок після перерваного запуску
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def _estimate_pixels(folder_path, files, size_index):
+    """{файл: кількість пікселів} за заголовками файлів (нечитабельні - 0)."""
+    pixels = {}
+    for file in files:
+        try:
+            width, height = size_index.get_size(os.path.join(folder_path, file))
+            pixels[file] = width * height
+        except Exception:
+            pixels[file] = 0
+    return pixels
+
+
+def _write_report(report_path, rows):
+    columns = ['folder', 'article', 'status', 'files', 'megapixels'] + list(FILE_STATUSES) + ['renamed', 'seconds']
+    # utf-8-sig - щоб Excel правильно показав кирилицю в шляхах
+    with open(report_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def process_articles(manifest_path, white_tolerance, padding_percent, workers=1, has_header=True, draft_decode=False,
+                     quiet=True, events_path=None, profile=DEFAULT_PROFILE, output_sizes=(1500,),
+                     suffix=DERIVATIVE_SUFFIX, tile_megapixels=TILE_MEGAPIXELS, skip_normalized=True,
+                     progress_path=None, report_path=None):
+    """
+    Обробляє всі папки з маніфесту (папка -> артикул) спільним пулом з workers процесів.
+
+    Папки стають у чергу від найбільшої за оцінкою пікселів до найменшої, тож великі
+    починаються першими, а дрібні заповнюють кінець і пул не простоює на одній папці.
+    Кожна завершена папка перейменовується і записується в журнал progress_path:
+    повторний запуск пропускає папки, вже оброблені з тим самим артикулом.
+    """
+    try:
+        get_profile(profile)
+    except ValueError as e:
+        print(f"Помилка: {e}")
+        return
+    output_sizes = list(output_sizes)
+    if not output_sizes or output_sizes != sorted(output_sizes, reverse=True):
+        print(f"Помилка: розміри результату мають іти за спаданням (основний - перший): {output_sizes}")
+        return
+    base_path = os.path.splitext(manifest_path)[0]
+    progress_path = progress_path or base_path + "_progress.jsonl"
+    report_path = report_path or base_path + "_report.csv"
+
+    entries = _merge_duplicate_folders(read_batch_manifest(manifest_path, has_header))
+    print(f"Маніфест: {manifest_path}, папок: {len(entries)}")
+    done = _load_progress(progress_path)
+
+    # Папки, що лишились, з файлами і оцінкою пікселів; рядки звіту - в порядку маніфесту
+    report_rows = {}
+    pending = []
+    with ImageSizeIndex() as size_index:
+        for folder_path, article in entries:
+            previous = done.get(folder_path)
+            if previous is not None and previous.get('article') == article and previous.get('status') in ('done', 'empty'):
+                report_rows[folder_path] = previous
+                continue
+            if not os.path.isdir(folder_path):
+                print(f"  ! Папку не знайдено: {folder_path}")
+                report_rows[folder_path] = {'folder': folder_path, 'article': article, 'status': 'missing'}
+                continue
+            # Попередній запуск міг перерватися посеред перейменування цієї папки
+            recover_renames(folder_path)
+            files = list_source_files(folder_path, output_sizes, suffix)
+            pixels = _estimate_pixels(folder_path, files, size_index)
+            pending.append((folder_path, article, files, pixels))
+    skipped = len(entries) - len(pending)
+    if skipped:
+        print(f"Пропущено (вже оброблені або відсутні): {skipped}")
+    if not pending:
+        _write_report(report_path, report_rows.values())
+        print(f"Звіт: {report_path}")
+        return
+
+    pending.sort(key=lambda item: sum(item[3].values()), reverse=True)
+    tasks = []
+    for folder_path, article, files, pixels in pending:
+        for file in sorted(files, key=lambda name: pixels[name], reverse=True):
+            tasks.append((folder_path, file, white_tolerance, padding_percent, draft_decode, profile, output_sizes,
+                          suffix, tile_megapixels, skip_normalized))
+    total_megapixels = sum(sum(item[3].values()) for item in pending) / 1000000
+    print(f"До обробки: папок {len(pending)}, файлів {len(tasks)}, ~{total_megapixels:.0f} Мп, процесів {workers}")
+
+    remaining = {folder_path: len(files) for folder_path, _, files, _ in pending}
+    folder_rows = {}
+    for folder_path, article, files, pixels in pending:
+        folder_rows[folder_path] = report_rows[folder_path] = {
+            'folder': folder_path, 'article': article, 'files': len(files),
+            'megapixels': round(sum(pixels.values()) / 1000000, 1), **{status: 0 for status in FILE_STATUSES}}
+    started = time.perf_counter()
+
+    metrics = StageMetrics(events_path, quiet)
+    previous_metrics = set_metrics(metrics)
+    try:
+        with open(progress_path, 'a', encoding='utf-8') as progress:
+            # Папки без файлів для обробки завершуються одразу
+            for folder_path, _, files, _ in pending:
+                if not files:
+                    _finish_folder(folder_rows[folder_path], profile, output_sizes, suffix, started, progress)
+            for args, status in run_tasks(convert_article_file, tasks, workers):
+                folder_path = args[0]
+                folder_rows[folder_path][status or 'failed'] += 1
+                remaining[folder_path] -= 1
+                if remaining[folder_path] == 0:
+                    _finish_folder(folder_rows[folder_path], profile, output_sizes, suffix, started, progress)
+        metrics.summary()
+    finally:
+        set_metrics(previous_metrics)
+        metrics.close()
+        _write_report(report_path, report_rows.values())
+
+    print(f"\n{'Папка':<40} | {'Артикул':<15} | {'Статус':<8} | {'ok':>4} | {'пропущ.':>7} | {'помилок':>7}")
+    print("-" * 96)
+    for row in report_rows.values():
+        print(f"{os.path.basename(row['folder'])[:40]:<40} | {row['article'][:15]:<15} | {row.get('status', '-'):<8} | "
+              f"{row.get('ok', 0):>4} | {row.get('skipped', 0):>7} | {row.get('failed', 0):>7}")
+    print(f"Звіт: {report_path}")
+
+
+def _finish_folder(row, profile, output_sizes, suffix, started, progress):
+    """Перейменовує оброблену папку і дописує її результат у журнал."""
+    print(f"\n--- Папка оброблена: {row['folder']} (артикул {row['article']}) ---")
+    row['renamed'] = rename_to_article(row['folder'], row['article'], profile, output_sizes, suffix)
+    if not row['files']:
+        row['status'] = 'empty'
+    else:
+        row['status'] = 'done' if row['renamed'] and not row['failed'] else 'failed'
+    row['seconds'] = round(time.perf_counter() - started, 1)  # Від початку пакета до завершення папки
+    progress.write(json.dumps(row, ensure_ascii=False) + "\n")
+    progress.flush()
+
+
+if __name__ == "__main__":
+    # --- Налаштування користувача ---
+    batch_manifest = r"C:\Users\ABM\Desktop\articles.xlsx"  # !!! CSV або Excel: колонка A - папка, колонка B - артикул
+    manifest_has_header = True            # !!! Перший рядок маніфесту - заголовки
+    tolerance_for_white = 0               # !!! Допуск для білого (0-255)
+    padding_percentage = 5                # !!! Відсоток полів (наприклад, 5 для 5%)
+    workers_count = os.cpu_count() or 1   # !!! Кількість процесів для всіх папок разом
+    use_draft_decode = True               # !!! Зменшене декодування великих JPEG (False - завжди повний розмір)
+    quiet_mode = True                     # !!! False - друкувати кроки обробки кожного файлу
+    events_log_path = None                # !!! Файл JSON Lines із замірами етапів кожного файлу (None - не писати)
+    encoder_profile = "archive"           # !!! Профіль кодування: fast, balanced, archive (JPEG q95 як раніше), webp, avif
+    output_sizes = [1500]                 # !!! Розміри результату за спаданням, наприклад [1500, 800, 300]; перший - основний файл
+    derivative_suffix = "_{size}px"       # !!! Правило імені похідних: photo.jpg -> photo_800px.jpg (не "_{size}" - так нумеруються артикули)
+    tile_megapixels = 24                  # !!! Кадри, більші за стільки мегапікселів, обрізаються смугами (None - без смуг)
+    skip_normalized = True                # !!! Не перекодовувати файли, що вже мають вигляд результату (так відновлення після переривання швидке)
+    # Журнал виконаних папок і звіт - поруч з маніфестом (<маніфест>_progress.jsonl, <маніфест>_report.csv)
+    # --- ---
+
+    if not os.path.isfile(batch_manifest):
+        print(f"Помилка: маніфест не знайдено: {batch_manifest}")
+    else:
+        process_articles(
+            batch_manifest,
+            tolerance_for_white,
+            padding_percentage,
+            workers=workers_count,
+            has_header=manifest_has_header,
+            draft_decode=use_draft_decode,
+            quiet=quiet_mode,
+            events_path=events_log_path,
+            profile=encoder_profile,
+            output_sizes=output_sizes,
+            suffix=derivative_suffix,
+            tile_megapixels=tile_megapixels,
+            skip_normalized=skip_normalized
+        )
+        print("\nРобота скрипту завершена.")
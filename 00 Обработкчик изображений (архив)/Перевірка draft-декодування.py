@@ -0,0 +1,83 @@
+import math
+import os
+import random
+import tempfile
+import time
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+from ImageCore import open_for_square, render_product_square
+
+# --- Налаштування ---
+# Папка з реальними JPEG для перевірки. Якщо порожньо - генеруються синтетичні фото.
+SOURCE_DIRECTORY = r""
+SYNTHETIC_SIZES = [(2000, 1500), (4000, 3000), (6000, 4000)]
+TOLERANCE = 10
+PADDING_PERCENT = 5
+TARGET_SIZE = 1500
+MIN_PSNR = 35.0  # Нижче цього значення (дБ) результат вважаємо помітно зміненим
+# --- ---
+
+
+def psnr(img_a, img_b):
+    """PSNR (дБ) між двома RGB зображеннями однакового розміру."""
+    diff = ImageChops.difference(img_a, img_b)
+    stat = ImageStat.Stat(diff)
+    mse = sum(stat.sum2) / (img_a.size[0] * img_a.size[1] * len(stat.sum2))
+    if mse == 0:
+        return float('inf')
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def make_synthetic_jpegs(folder):
+    """Створює JPEG "фото товарів" з об'єктом на 60-80% кадру на білому фоні."""
+    paths = []
+    for i, (width, height) in enumerate(SYNTHETIC_SIZES):
+        rnd = random.Random(i)
+        img = Image.new('RGB', (width, height), (255, 255, 255))
+        draw = ImageDraw.Draw(img)
+        for _ in range(20):
+            x0 = rnd.randint(width // 8, width // 2)
+            y0 = rnd.randint(height // 8, height // 2)
+            x1 = rnd.randint(width // 2, width * 7 // 8)
+            y1 = rnd.randint(height // 2, height * 7 // 8)
+            draw.ellipse((x0, y0, x1, y1), fill=tuple(rnd.randint(0, 230) for _ in range(3)))
+        path = os.path.join(folder, f"synthetic_{width}x{height}.jpg")
+        img.save(path, quality=92)
+        paths.append(path)
+    return paths
+
+
+def render(path, draft):
+    """Повертає (квадрат TARGET_SIZE, розмір після декодування, секунди)."""
+    start = time.perf_counter()
+    with open_for_square(path, TOLERANCE, PADDING_PERCENT, TARGET_SIZE, draft=draft) as img:
+        img.load()
+        decoded_size = img.size
+        result = render_product_square(img, TOLERANCE, PADDING_PERCENT, TARGET_SIZE)
+        result = result.copy() if result is not None else None  # холст перевикористовується
+    return result, decoded_size, time.perf_counter() - start
+
+
+def run_check(paths):
+    print(f"{'Файл':<30} | {'Декодовано':>11} | {'Повний, мс':>10} | {'Draft, мс':>9} | {'PSNR, дБ':>8} | Висновок")
+    print("-" * 90)
+    for path in paths:
+        full, _, full_time = render(path, draft=False)
+        reduced, decoded_size, draft_time = render(path, draft=True)
+        if full is None or reduced is None:
+            print(f"{os.path.basename(path):<30} | порожнє зображення, пропуск")
+            continue
+        value = psnr(full, reduced)
+        verdict = "ок" if value >= MIN_PSNR else "ПОМІТНА РІЗНИЦЯ"
+        print(f"{os.path.basename(path):<30} | {decoded_size[0]:>5}x{decoded_size[1]:<5} | "
+              f"{full_time * 1000:>10.0f} | {draft_time * 1000:>9.0f} | {value:>8.1f} | {verdict}")
+
+
+if __name__ == "__main__":
+    if SOURCE_DIRECTORY:
+        jpeg_paths = sorted(os.path.join(SOURCE_DIRECTORY, f) for f in os.listdir(SOURCE_DIRECTORY)
+                            if f.lower().endswith(('.jpg', '.jpeg')))
+        run_check(jpeg_paths)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            run_check(make_synthetic_jpegs(temp_dir))
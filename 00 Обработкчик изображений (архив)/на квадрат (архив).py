@@ -1,60 +1,119 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import io
 import os
 import sys
 from pathlib import Path
 from PIL import Image, ImageOps
 import argparse
 
+from BatchRunner import run_pipelined
+from EncoderProfiles import available_profiles, get_profile, save_image
+from ImageCore import to_srgb
+from ImageSizeIndex import ImageSizeIndex
+from ProcessingManifest import ProcessingManifest
 
-def make_image_square(image_path, background_color=(255, 255, 255)):
+
+def square_canvas(img, background_color=(255, 255, 255)):
+    """
+    Кладет изображение по центру квадратного RGB холста со стороной по длинной стороне
+
+    Args:
+        img (Image): Исходное изображение (любой режим)
+        background_color (tuple): Цвет фона (R, G, B)
+
+    Returns:
+        Image: Квадратное RGB изображение
+    """
+    # Встроенный цветовой профиль (CMYK, Adobe RGB) -> sRGB и поворот по EXIF
+    img = to_srgb(img)
+    width, height = img.size
+
+    # Конвертируем в RGB если нужно (для PNG с прозрачностью)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        # Создаем белый фон для прозрачных изображений
+        rgb_img = Image.new('RGB', img.size, background_color)
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = rgb_img
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    # Определяем размер квадрата (по длинной стороне)
+    square_size = max(width, height)
+
+    # Создаем квадратный холст с фоном
+    square_img = Image.new('RGB', (square_size, square_size), background_color)
+
+    # Вычисляем позицию для центрирования изображения
+    x_offset = (square_size - width) // 2
+    y_offset = (square_size - height) // 2
+
+    # Вставляем изображение в центр квадратного холста
+    square_img.paste(img, (x_offset, y_offset))
+    return square_img
+
+
+_profile_mismatches = set()  # (профиль, формат), о которых уже предупредили в этом запуске
+
+
+def save_square(square_img, target, image_format, profile=None):
+    """
+    Сохраняет квадрат в файл или файловый объект target
+
+    Профиль кодирования (EncoderProfiles) применяется, если его формат совпадает с форматом
+    файла (например, 'fast' или 'balanced' для JPEG) - расширение файла не меняется.
+    Иначе, как и раньше, качество 95 с оптимизацией (с предупреждением один раз за запуск).
+    """
+    if profile:
+        profile_format = get_profile(profile)['format']
+        if profile_format == image_format:
+            save_image(square_img, target, profile)
+            return
+        if (profile, image_format) not in _profile_mismatches:
+            _profile_mismatches.add((profile, image_format))
+            print(f"⚠️  Профиль '{profile}' ({profile_format}) не подходит для файлов {image_format}: "
+                  f"они сохраняются в своем формате с качеством 95")
+    square_img.save(target, format=image_format, quality=95, optimize=True)
+
+
+def make_image_square(image_path, background_color=(255, 255, 255), size_index=None, profile=None):
     """
     Преобразует изображение в квадратное, добавляя фон по длинной стороне
 
     Args:
         image_path (Path): Путь к изображению
         background_color (tuple): Цвет фона (R, G, B)
+        size_index (ImageSizeIndex): Индекс размеров; уже квадратные файлы тогда не открываются
+        profile (str): Профиль кодирования для файлов того же формата (None - качество 95)
 
     Returns:
         bool: True если успешно, False если ошибка
     """
     try:
+        # Размер по индексу (только заголовок файла) - квадратные пропускаем без открытия
+        if size_index is not None:
+            width, height = size_index.get_size(image_path)
+            if width == height:
+                print(f"⏭️  Пропущен: '{image_path.name}' (уже квадратное {width}x{height})")
+                return True
+
         # Открываем изображение
         with Image.open(image_path) as img:
-            # Конвертируем в RGB если нужно (для PNG с прозрачностью)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Создаем белый фон для прозрачных изображений
-                rgb_img = Image.new('RGB', img.size, background_color)
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = rgb_img
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-
             width, height = img.size
 
-            # Проверяем, является ли изображение уже квадратным
+            # Проверяем, является ли изображение уже квадратным (до конвертации - она декодирует пиксели)
             if width == height:
                 print(f"⏭️  Пропущен: '{image_path.name}' (уже квадратное {width}x{height})")
                 return True
 
-            # Определяем размер квадрата (по длинной стороне)
-            square_size = max(width, height)
-
-            # Создаем квадратный холст с фоном
-            square_img = Image.new('RGB', (square_size, square_size), background_color)
-
-            # Вычисляем позицию для центрирования изображения
-            x_offset = (square_size - width) // 2
-            y_offset = (square_size - height) // 2
-
-            # Вставляем изображение в центр квадратного холста
-            square_img.paste(img, (x_offset, y_offset))
+            square_img = square_canvas(img, background_color)
+            square_size = square_img.size[0]
 
             # Сохраняем с тем же именем (заменяем оригинал)
-            square_img.save(image_path, quality=95, optimize=True)
+            save_square(square_img, image_path, Image.registered_extensions()[image_path.suffix.lower()], profile)
 
             print(f"✅ Обработан: '{image_path.name}' ({width}x{height} -> {square_size}x{square_size})")
             return True
@@ -64,7 +123,53 @@ def make_image_square(image_path, background_color=(255, 255, 255)):
         return False
 
 
-def process_images_in_directory(directory_path, recursive=False, background_color=(255, 255, 255)):
+# --- Этапы конвейера (чтение -> обработка -> запись) для сетевых папок ---
+def read_square_source(image_path, size_index=None):
+    """Этап чтения: байты файла или True, если по индексу размеров оно уже квадратное"""
+    if size_index is not None:
+        width, height = size_index.get_size(image_path)
+        if width == height:
+            print(f"⏭️  Пропущен: '{image_path.name}' (уже квадратное {width}x{height})")
+            return True
+    with open(image_path, 'rb') as f:
+        return f.read()
+
+
+def square_image_bytes(image_path, data, background_color=(255, 255, 255), profile=None):
+    """Этап обработки: квадрат, закодированный в формат по расширению файла, или True, если делать нечего"""
+    if data is True:
+        return True
+    with Image.open(io.BytesIO(data)) as img:
+        width, height = img.size
+        if width == height:
+            print(f"⏭️  Пропущен: '{image_path.name}' (уже квадратное {width}x{height})")
+            return True
+        square_img = square_canvas(img, background_color)
+        buffer = io.BytesIO()
+        save_square(square_img, buffer, Image.registered_extensions()[image_path.suffix.lower()], profile)
+    square_size = square_img.size[0]
+    print(f"✅ Обработан: '{image_path.name}' ({width}x{height} -> {square_size}x{square_size})")
+    return buffer.getvalue()
+
+
+def write_square_image(image_path, result):
+    """Этап записи: заменяет оригинал готовыми байтами"""
+    if result is not True:
+        with open(image_path, 'wb') as f:
+            f.write(result)
+    return True
+# --- ---
+
+
+def _folder_manifest(manifests, folder):
+    """Манифест папки folder - один на весь запуск (закрываются все вместе в конце)"""
+    if folder not in manifests:
+        manifests[folder] = ProcessingManifest(folder, 'make_square')
+    return manifests[folder]
+
+
+def process_images_in_directory(directory_path, recursive=False, background_color=(255, 255, 255), force=False,
+                                prefetch_depth=0, write_depth=4, profile=None):
     """
     Обрабатывает все изображения в директории
 
@@ -72,6 +177,10 @@ def process_images_in_directory(directory_path, recursive=False, background_colo
         directory_path (str): Путь к директории
         recursive (bool): Обрабатывать поддиректории рекурсивно
         background_color (tuple): Цвет фона (R, G, B)
+        force (bool): Обрабатывать все файлы, игнорируя манифест папки
+        prefetch_depth (int): Сколько файлов читать наперед (0 - без конвейера, файлы по одному)
+        write_depth (int): Сколько готовых файлов может ждать записи в конвейере
+        profile (str): Профиль кодирования для файлов того же формата (None - качество 95)
 
     Returns:
         bool: True если успешно
@@ -103,21 +212,64 @@ def process_images_in_directory(directory_path, recursive=False, background_colo
 
         processed_count = 0
         skipped_count = 0
+        unchanged_count = 0
         error_count = 0
 
+        # Манифест ведется отдельно для каждой папки (при рекурсивном обходе их несколько)
+        params = {'background_color': background_color}
+        if profile:
+            params['profile'] = profile
+        manifests = {}
+        try:
+            size_index = ImageSizeIndex()
+        except Exception as e:
+            print(f"⚠️  Индекс размеров недоступен, размеры читаются из файлов: {e}")
+            size_index = None
+
         print(f"🔍 Найдено изображений: {len(image_files)}")
         print("=" * 70)
 
+        # Отбираем файлы, изменившиеся с прошлой обработки
+        tasks = []
         for image_file in image_files:
-            try:
+            manifest = _folder_manifest(manifests, str(image_file.parent))
+            if not force and manifest.is_up_to_date(image_file.name, params):
+                unchanged_count += 1
+                continue
+            tasks.append(image_file)
+
+        def process_sequentially():
+            for image_file in tasks:
                 # Получаем относительный путь для красивого вывода
                 if recursive:
                     relative_path = image_file.relative_to(path)
                     print(f"📂 Обрабатываем: {relative_path}")
+                yield image_file, make_image_square(image_file, background_color, size_index, profile)
+
+        if prefetch_depth > 0:
+            # Чтение следующих и запись готовых файлов идут параллельно с обработкой текущего
+            results = run_pipelined(
+                tasks,
+                read=lambda image_file: read_square_source(image_file, size_index),
+                process=lambda image_file, data: square_image_bytes(image_file, data, background_color, profile),
+                write=write_square_image,
+                prefetch_depth=prefetch_depth,
+                write_depth=write_depth,
+            )
+        else:
+            results = process_sequentially()
 
-                result = make_image_square(image_file, background_color)
+        manifest = None
+        for image_file, result in results:
+            try:
+                folder_manifest = _folder_manifest(manifests, str(image_file.parent))
+                # Файлы идут по папкам: дописывание в манифест прошлой папки закончено
+                if manifest is not None and manifest is not folder_manifest:
+                    manifest.release()
+                manifest = folder_manifest
 
                 if result:
+                    manifest.record(image_file.name, params)
                     if "Пропущен" in str(result):
                         skipped_count += 1
                     else:
@@ -129,10 +281,16 @@ def process_images_in_directory(directory_path, recursive=False, background_colo
                 print(f"❌ Неожиданная ошибка с '{image_file.name}': {e}")
                 error_count += 1
 
+        for manifest in manifests.values():
+            manifest.close()
+        if size_index is not None:
+            size_index.close()
+
         print("=" * 70)
         print(f"📊 Результат:")
         print(f"   Обработано: {processed_count} изображений")
         print(f"   Пропущено (уже квадратные): {skipped_count} изображений")
+        print(f"   Пропущено (без изменений по манифесту): {unchanged_count} изображений")
         print(f"   Ошибок: {error_count}")
 
         return True
@@ -142,13 +300,14 @@ def process_images_in_directory(directory_path, recursive=False, background_colo
         return False
 
 
-def process_single_image(image_path, background_color=(255, 255, 255)):
+def process_single_image(image_path, background_color=(255, 255, 255), profile=None):
     """
     Обрабатывает одно изображение
 
     Args:
         image_path (str): Путь к изображению
         background_color (tuple): Цвет фона (R, G, B)
+        profile (str): Профиль кодирования для файлов того же формата (None - качество 95)
 
     Returns:
         bool: True если успешно
@@ -172,7 +331,7 @@ def process_single_image(image_path, background_color=(255, 255, 255)):
     print(f"🖼️  Обрабатываем изображение: {path.name}")
     print("=" * 50)
 
-    result = make_image_square(path, background_color)
+    result = make_image_square(path, background_color, profile=profile)
 
     if result:
         print("✨ Обработка завершена успешно!")
@@ -240,6 +399,16 @@ def main():
                         help='Обрабатывать поддиректории рекурсивно (только для -d)')
     parser.add_argument('--color', default='white',
                         help='Цвет фона (white, black, red, green, blue, gray или R,G,B). По умолчанию: white')
+    parser.add_argument('--force', action='store_true',
+                        help='Обработать все файлы заново, игнорируя манифест папки (только для -d)')
+    parser.add_argument('--prefetch', type=int, default=0,
+                        help='Сколько файлов читать наперед, пока обрабатывается текущий (только для -d). '
+                             'По умолчанию: 0 - без конвейера')
+    parser.add_argument('--profile', choices=available_profiles(),
+                        help='Профиль кодирования для файлов того же формата (fast, balanced, archive, webp, avif). '
+                             'По умолчанию: качество 95, как раньше')
+    parser.add_argument('--write-queue', type=int, default=4,
+                        help='Сколько готовых файлов может ждать записи при --prefetch. По умолчанию: 4')
 
     args = parser.parse_args()
 
@@ -252,7 +421,7 @@ def main():
 
     if args.file:
         # Обрабатываем один файл
-        success = process_single_image(args.file, background_color)
+        success = process_single_image(args.file, background_color, args.profile)
     else:
         # Обрабатываем директорию
         print(f"📂 Обрабатываем директорию: {args.directory}")
@@ -260,7 +429,8 @@ def main():
             print("🔄 Режим: рекурсивная обработка поддиректорий")
         print()
 
-        success = process_images_in_directory(args.directory, args.recursive, background_color)
+        success = process_images_in_directory(args.directory, args.recursive, background_color, args.force,
+                                              args.prefetch, args.write_queue, args.profile)
 
     if success:
         print("\n✨ Операция завершена!")
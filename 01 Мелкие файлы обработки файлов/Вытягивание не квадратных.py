@@ -1,5 +1,9 @@
 import os
-from PIL import Image
+import sys
+
+# Общие модули обработки изображений лежат в папке "00 Обработкчик изображений (архив)"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Обработкчик изображений (архив)'))
+from ImageSizeIndex import ImageSizeIndex
 
 # Поддерживаемые расширения изображений
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.webp'}
@@ -9,11 +13,13 @@ source_folder = r"\\10.10.100.2\Foto\LUKKY"
 target_folder = r"C:\Users\ABM\Downloads\test"
 
 
-def is_image_square(image_path):
+def is_image_square(image_path, size_index, dir_entry=None):
     try:
-        with Image.open(image_path) as img:
-            width, height = img.size
-            return width == height
+        # Размер берется из индекса или из заголовка файла, пиксели не читаются.
+        # stat из os.scandir на Windows приходит вместе со списком папки, без лишних запросов к сети
+        stat_result = dir_entry.stat() if dir_entry is not None else None
+        width, height = size_index.get_size(image_path, stat_result)
+        return width == height
     except Exception as e:
         print(f"Ошибка при обработке файла {image_path}: {e}")
         return True  # Пропускаем поврежденные файлы
@@ -23,8 +29,10 @@ def main():
     if not os.path.exists(target_folder):
         os.makedirs(target_folder)
 
-    for filename in os.listdir(source_folder):
-        file_path = os.path.join(source_folder, filename)
+    size_index = ImageSizeIndex()
+    for entry in os.scandir(source_folder):
+        filename = entry.name
+        file_path = entry.path
 
         # Проверяем, является ли файл изображением
         name, ext = os.path.splitext(filename.lower())
@@ -36,7 +44,7 @@ def main():
             continue
 
         # Проверяем соотношение сторон
-        if not is_image_square(file_path):
+        if not is_image_square(file_path, size_index, entry):
             target_path = os.path.join(target_folder, filename)
             try:
                 import shutil
@@ -45,6 +53,7 @@ def main():
             except Exception as e:
                 print(f"Не удалось скопировать {filename}: {e}")
 
+    size_index.close()
     print("Обработка завершена.")
 
 
@@ -0,0 +1,45 @@
+import os
+import sys
+
+# Общие модули обработки изображений лежат в папке "00 Обработкчик изображений (архив)"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '00 Обработкчик изображений (архив)'))
+from PerceptualHashIndex import PerceptualHashIndex
+
+
+def main():
+    # Укажите настройки здесь ↓↓↓
+    photo_root = r"\\10.10.100.2\Foto"   # Папка, которую индексируем (вместе с подпапками)
+    query_file = None                    # Файл, для которого ищем похожие (None - вывести все группы дубликатов)
+    max_distance = 6                     # Сколько бит хеша может отличаться (0 - только практически идентичные)
+    workers_count = os.cpu_count() or 1  # Сколько процессов считают хеши
+    # Указывать настройки выше ↑↑↑
+
+    with PerceptualHashIndex() as index:
+        # Хешируются только новые и измененные файлы, остальные берутся из локального индекса
+        print(f"Обновляем индекс: {photo_root}")
+        hashed, removed = index.update(photo_root, workers=workers_count)
+        print(f"Посчитано хешей: {hashed}, удалено записей: {removed}")
+
+        if query_file:
+            similar = index.find_similar(query_file, max_distance)
+            if similar:
+                print(f"\nПохожие на {query_file}:")
+                for distance, path in similar:
+                    print(f"  [{distance}] {path}")
+            else:
+                print(f"\nПохожих на {query_file} не найдено.")
+            return
+
+        clusters = index.duplicate_clusters(max_distance)
+        if clusters:
+            print(f"\nНайдено групп похожих фото: {len(clusters)}")
+            for number, paths in enumerate(clusters, 1):
+                print(f"\nГруппа {number} ({len(paths)} шт.):")
+                for path in paths:
+                    print(f"  {path}")
+        else:
+            print("\nПохожих фото не найдено.")
+
+
+if __name__ == '__main__':
+    main()